@@ -1,6 +1,6 @@
 from fastapi import FastAPI
-from app.api import basic_router
-from app.sequences import farm_ops_router
+from app.api import basic_router, jobs_router, stream_router, metrics_router, controllers_router, gateway_router
+from app.sequences import farm_ops_router, history_router
 
 def create_app(lifespan=None):
     """Create and configure the FastAPI application."""
@@ -11,6 +11,26 @@ def create_app(lifespan=None):
     
     # Register routers
     app.include_router(basic_router)
+    app.include_router(jobs_router)
+    app.include_router(stream_router)
+    app.include_router(metrics_router)
+    app.include_router(controllers_router)
     app.include_router(farm_ops_router)
+    app.include_router(history_router)
     
+    return app
+
+def create_gateway(lifespan=None):
+    """Create the API run by worker processes while a device daemon owns the hardware."""
+    app = FastAPI(
+        title="AGRO: CNC Farming System API",
+        lifespan=lifespan,
+        openapi_url=None
+    )
+
+    # History is read from MongoDB here; everything else, docs included, goes to the daemon.
+    # Local routes first: the gateway router matches every path
+    app.include_router(history_router)
+    app.include_router(gateway_router)
+
     return app 
\ No newline at end of file
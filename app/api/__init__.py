@@ -1,3 +1,8 @@
 from .basic import router as basic_router
+from .jobs import router as jobs_router
+from .stream import router as stream_router
+from .metrics import router as metrics_router
+from .controllers import router as controllers_router
+from .gateway import router as gateway_router
 
-__all__ = ["basic_router"] 
\ No newline at end of file
+__all__ = ["basic_router", "jobs_router", "stream_router", "metrics_router", "controllers_router", "gateway_router"]
\ No newline at end of file
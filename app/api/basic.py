@@ -1,57 +1,155 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
+from typing import Optional
 from app.models import CommandRequest, JogRequest, SlotMoveRequest
-from app.core import cnc, grid_positions, soil_moisture, update_soil_moisture_data
+from app.core import Controller, update_soil_moisture_data
+from app.core.cnc import REALTIME_COMMANDS
+from app.core.jog import parse_jog
+from .controllers import get_controller
 
 router = APIRouter(tags=["basic_controls"])
 
 @router.get("/status")
-def check_status():
+def check_status(controller: Controller = Depends(get_controller)):
     """Check if the CNC machine is connected and ready to receive commands."""
+    cnc = controller.cnc
     is_connected = cnc.serial_conn is not None
     return {
         "online": is_connected,
+        "state": cnc.state,
         "message": "CNC machine is connected and ready" if is_connected else "CNC machine is not connected"
     }
 
 @router.get("/position")
-def get_position():
+def get_position(controller: Controller = Depends(get_controller)):
     """Get the current position of the CNC machine."""
-    return cnc.position
+    return controller.cnc.position
+
+async def _interactive(controller: Controller, command: str, wait: bool, target=None):
+    """Run an operator command ahead of any sequence, which pauses at its next safe point."""
+    cnc = controller.cnc
+    async with cnc.scheduler.interactive():
+        response = await cnc.send_command(command)
+        result = {"response": response}
+        if wait and response == "ok":
+            result["motion"] = await cnc.wait_for_idle(target=target)
+    return result
 
 @router.post("/send-command")
-def send_command(request: CommandRequest):
-    """Send a raw G-code command to the CNC machine."""
-    response = cnc.send_command_and_wait_response(request.command)
-    return {"status": "sent", "response": response}
+async def send_command(request: CommandRequest, wait: bool = False, controller: Controller = Depends(get_controller)):
+    """Send a raw G-code command to the CNC machine; with `wait=true`, return once its motion has finished."""
+    command = request.command.strip()
+    if not command or "\n" in command or "\r" in command:
+        raise HTTPException(status_code=400, detail="Command must be a single non-empty line")
+    if command in REALTIME_COMMANDS:
+        controller.cnc.scheduler.realtime(command)
+        return {"status": "sent", "response": "ok"}
+    return {"status": "sent", **await _interactive(controller, command, wait)}
 
 @router.post("/jog")
-def jog_move(jog: JogRequest):
-    """Perform a relative movement in the specified direction."""
-    response = cnc.send_command_and_wait_response(f"G91 G0 {jog.direction}")
-    return {"message": f"Jogged {jog.direction}", "response": response}
+async def jog_move(jog: JogRequest, wait: bool = False, controller: Controller = Depends(get_controller)):
+    """Jog by a relative distance such as "X10" or "X-1 Y1"; with `wait=true`, return once the jog has stopped."""
+    try:
+        deltas = parse_jog(jog.direction)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Requests close together are merged into one move
+    result = await controller.jog.jog(deltas, feed=jog.feed)
+    if wait and result["response"] == "ok":
+        result["motion"] = await controller.jog.wait_for_stop()
+    return {"message": f"Jogged {jog.direction}", **result}
+
+@router.post("/jog/cancel")
+def jog_cancel(controller: Controller = Depends(get_controller)):
+    """Stop jogging at once, dropping queued jog motion (GRBL jog cancel); sent when a jog button is released."""
+    controller.jog.cancel()
+    return {"status": "sent"}
 
 @router.post("/move-to-slot")
-def move_to_slot(slot: SlotMoveRequest):
-    """Move to a specific slot in the grid."""
-    pos = grid_positions.get((slot.slot_row, slot.slot_col))
+async def move_to_slot(slot: SlotMoveRequest, wait: bool = False, controller: Controller = Depends(get_controller)):
+    """Move to a specific slot in the grid; with `wait=true`, return once it is there."""
+    pos = controller.grid.gcode(slot.slot_row, slot.slot_col)
     if not pos:
         raise HTTPException(status_code=404, detail="Invalid slot")
-    response = cnc.send_command_and_wait_response(f"G90 G0 {pos}")
-    return {"message": f"Moved to slot ({slot.slot_row+1}, {slot.slot_col+1})", "response": response}
+    target = controller.grid.coordinates(slot.slot_row, slot.slot_col)
+    return {"message": f"Moved to slot ({slot.slot_row+1}, {slot.slot_col+1})",
+            **await _interactive(controller, f"G90 G0 {pos}", wait, target=target)}
+
+@router.post("/feed-hold")
+def feed_hold(controller: Controller = Depends(get_controller)):
+    """Decelerate to a stop at once, keeping the buffered program (GRBL `!`)."""
+    controller.cnc.scheduler.realtime("!")
+    return {"status": "sent"}
+
+@router.post("/cycle-start")
+def cycle_start(controller: Controller = Depends(get_controller)):
+    """Continue after a feed hold (GRBL `~`)."""
+    controller.cnc.scheduler.realtime("~")
+    return {"status": "sent"}
+
+@router.post("/soft-reset")
+def soft_reset(controller: Controller = Depends(get_controller)):
+    """Stop immediately and discard everything buffered (GRBL Ctrl-X); running sequences fail."""
+    controller.cnc.scheduler.realtime("\x18")
+    return {"status": "sent"}
+
+@router.post("/pause-sequences")
+async def pause_sequences(controller: Controller = Depends(get_controller)):
+    """Pause sequences on the controller at their next safe point, leaving it to interactive commands."""
+    await controller.cnc.scheduler.pause()
+    return controller.cnc.scheduler.summary()
+
+@router.post("/resume-sequences")
+async def resume_sequences(controller: Controller = Depends(get_controller)):
+    """Let paused sequences continue."""
+    await controller.cnc.scheduler.resume()
+    return controller.cnc.scheduler.summary()
+
+@router.get("/grid")
+def get_grid(controller: Controller = Depends(get_controller)):
+    """Get the size and extent of the planting grid."""
+    return controller.grid.summary()
 
 @router.get("/soil-moisture")
-def get_soil_moisture():
-    """Get the current soil moisture readings for all slots."""
-    return {"moisture": soil_moisture}
+def get_soil_moisture(controller: Controller = Depends(get_controller)):
+    """Get the current soil moisture readings for all slots as a rows x cols matrix."""
+    return Response(content=controller.moisture.snapshot(), media_type="application/json")
+
+@router.get("/soil-moisture/below")
+def get_dry_slots(threshold: float, controller: Controller = Depends(get_controller)):
+    """Get the slots whose current moisture is below `threshold`."""
+    return {"threshold": threshold, "slots": controller.moisture.below(threshold)}
+
+@router.get("/soil-moisture/recent")
+def get_recent_moisture(row: int, col: int, controller: Controller = Depends(get_controller)):
+    """Get a slot's recent readings from memory and their trend in points per hour."""
+    soil_moisture = controller.moisture
+    if (row, col) not in controller.grid:
+        raise HTTPException(status_code=404, detail="Invalid slot")
+    return {
+        "row": row,
+        "col": col,
+        "readings": soil_moisture.history(row, col),
+        "trend_per_hour": soil_moisture.trend(row, col)
+    }
+
+@router.get("/soil-moisture/forecast")
+async def get_moisture_forecast(threshold: Optional[float] = None, controller: Controller = Depends(get_controller)):
+    """Get each slot's predicted moisture and drying rate, and with `threshold` the slots to sense."""
+    await controller.forecast.calibrate(controller.id)
+    return controller.forecast.summary(threshold)
 
 @router.post("/update-soil-moisture")
-def update_soil_moisture():
+def update_soil_moisture(controller: Controller = Depends(get_controller)):
     """Update soil moisture with random values (simulation)."""
-    update_soil_moisture_data()
-    cnc.log("Soil moisture updated!")
+    update_soil_moisture_data(controller.moisture)
+    controller.cnc.log("Soil moisture updated!")
     return {"message": "Soil moisture updated."}
 
 @router.get("/logs")
-def get_logs():
-    """Get the latest CNC machine logs."""
-    return {"logs": cnc.logs[-50:]}  # last 50 logs 
\ No newline at end of file
+def get_logs(since: Optional[int] = None, direction: Optional[str] = None,
+             level: Optional[str] = None, limit: int = 50,
+             controller: Controller = Depends(get_controller)):
+    """Get CNC machine logs newer than `since`, or the latest ones when it is omitted."""
+    logs = controller.cnc.logs
+    entries, next_seq, truncated = logs.since(since, direction=direction, level=level, limit=limit)
+    return {"logs": entries, "next_seq": next_seq, "truncated": truncated} 
\ No newline at end of file
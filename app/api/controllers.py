@@ -0,0 +1,18 @@
+from fastapi import APIRouter, HTTPException
+from typing import Optional
+from app.core import controllers, Controller
+
+router = APIRouter(tags=["controllers"])
+
+def get_controller(controller: Optional[str] = None) -> Controller:
+    """The controller named by the `controller` query parameter, or the default one."""
+    try:
+        return controllers.get(controller)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown controller: {controller}")
+
+@router.get("/controllers")
+def list_controllers():
+    """List the configured CNC controllers with their connection state and grid."""
+    return {"controllers": [controller.summary() for controller in controllers.all()],
+            "default": controllers.default.id}
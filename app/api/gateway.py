@@ -0,0 +1,71 @@
+import asyncio
+import contextlib
+from fastapi import APIRouter, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from websockets.exceptions import ConnectionClosed, InvalidStatus
+from app.core import device_client, DeviceUnavailable
+from app.core.device import forwarded_headers
+
+router = APIRouter(tags=["gateway"])
+
+@router.api_route("/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE"], include_in_schema=False)
+async def forward(request: Request, path: str):
+    """Forward a request to the device daemon and stream its response back."""
+    try:
+        response = await device_client.send(request.method, request.url.path, request.url.query,
+                                            request.headers, await request.body())
+    except DeviceUnavailable:
+        return JSONResponse(status_code=503, content={"detail": "Device daemon unavailable"})
+    return StreamingResponse(response.aiter_raw(), status_code=response.status_code,
+                             headers=forwarded_headers(response.headers),
+                             background=BackgroundTask(response.aclose))
+
+async def _deny(websocket: WebSocket, status_code: int, detail: str):
+    """Refuse the WebSocket with an HTTP response, or a close frame if the server cannot send one."""
+    try:
+        await websocket.send_denial_response(JSONResponse(status_code=status_code, content={"detail": detail}))
+    except RuntimeError:
+        await websocket.close(code=1011 if status_code >= 500 else 1008, reason=detail)
+
+@router.websocket("/{path:path}")
+async def forward_websocket(websocket: WebSocket, path: str):
+    """Relay a WebSocket to the device daemon, in both directions, until either side closes."""
+    try:
+        upstream_connection = device_client.websocket(websocket.url.path, websocket.url.query)
+        upstream = await upstream_connection.__aenter__()
+    except InvalidStatus as e:
+        # The daemon refused it, e.g. an unknown controller
+        await _deny(websocket, e.response.status_code, "Rejected by device daemon")
+        return
+    except (OSError, asyncio.TimeoutError):
+        await _deny(websocket, 503, "Device daemon unavailable")
+        return
+
+    await websocket.accept()
+
+    async def downstream_pump():
+        async for message in upstream:
+            if isinstance(message, bytes):
+                await websocket.send_bytes(message)
+            else:
+                await websocket.send_text(message)
+
+    async def upstream_pump():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            await upstream.send(message.get("text") if message.get("text") is not None else message["bytes"])
+
+    tasks = [asyncio.create_task(downstream_pump()), asyncio.create_task(upstream_pump())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        with contextlib.suppress(asyncio.CancelledError, ConnectionClosed, RuntimeError):
+            await asyncio.gather(*tasks, return_exceptions=True)
+        await upstream_connection.__aexit__(None, None, None)
+        with contextlib.suppress(RuntimeError, WebSocketDisconnect):
+            await websocket.close()
@@ -0,0 +1,42 @@
+from fastapi import APIRouter, HTTPException
+from app.core import job_manager
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+def _get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("")
+def list_jobs():
+    """List queued, running and recently finished jobs, newest first."""
+    return {"jobs": [job.to_dict() for job in job_manager.list()]}
+
+@router.get("/{job_id}")
+def get_job(job_id: str):
+    """Get the status and overall progress of a job."""
+    return _get_job(job_id).to_dict()
+
+@router.get("/{job_id}/progress")
+def get_job_progress(job_id: str):
+    """Get per-slot progress of a job."""
+    job = _get_job(job_id)
+    return {"job_id": job.id, "status": job.status, "progress": job.progress}
+
+@router.get("/{job_id}/result")
+def get_job_result(job_id: str):
+    """Get the result of a finished job."""
+    job = _get_job(job_id)
+    if job.status in ("queued", "running"):
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return job.to_dict(include_result=True)
+
+@router.post("/{job_id}/cancel")
+def cancel_job(job_id: str):
+    """Cancel a queued job, or stop a running one after its current slot."""
+    job = job_manager.cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
@@ -0,0 +1,11 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.core.metrics import registry
+
+router = APIRouter(tags=["metrics"])
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Latency histograms, counters and queue depths in the Prometheus text format."""
+    # Runs on the event loop so gauges read the queues they report without racing them
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,47 @@
+import asyncio
+import contextlib
+import json
+from datetime import datetime, UTC
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from app.core import Controller
+from .controllers import get_controller
+
+router = APIRouter(tags=["streaming"])
+
+def _snapshot(controller: Controller):
+    """Current state sent to a new subscriber before any live updates."""
+    return json.dumps({"type": "status", "timestamp": datetime.now(UTC).isoformat(),
+                       "controller": controller.id, **controller.cnc.status()}, default=str)
+
+@router.get("/stream")
+async def stream_events(controller: Controller = Depends(get_controller)):
+    """Server-Sent Events stream of machine status changes and new log lines."""
+    async def event_source():
+        yield f"data: {_snapshot(controller)}\n\n"
+        async for message in controller.cnc.events.subscribe():
+            yield f"data: {message}\n\n"
+
+    return StreamingResponse(event_source(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+@router.websocket("/ws")
+async def websocket_events(websocket: WebSocket, controller: Controller = Depends(get_controller)):
+    """WebSocket stream of machine status changes and new log lines."""
+    await websocket.accept()
+
+    async def send_events():
+        await websocket.send_text(_snapshot(controller))
+        async for message in controller.cnc.events.subscribe():
+            await websocket.send_text(message)
+
+    sender = asyncio.create_task(send_events())
+    try:
+        # Sending alone only notices a closed client at the next event, which
+        # may never come and would hold up shutdown; receiving notices at once
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    finally:
+        sender.cancel()
+        with contextlib.suppress(asyncio.CancelledError, WebSocketDisconnect):
+            await sender
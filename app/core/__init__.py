@@ -1,28 +1,60 @@
-from .cnc import cnc
-from .grid import grid_positions, soil_moisture, update_soil_moisture_data
+from .grid import grid, Grid, load_grid
+from .moisture import soil_moisture, update_soil_moisture_data, MoistureStore
+from .controllers import controllers, cnc, Controller
+from .planner import plan_route, route_length
 from .database import (
     connect_to_mongo, 
     close_mongo_connection,
+    batch_writer,
     save_maintenance_cycle,
     get_maintenance_cycles,
     save_soil_moisture_reading,
     get_soil_moisture_history,
-    save_planting_operation
+    save_planting_operation,
+    replace_image_reference
 )
-from .storage import generate_mock_plant_image, upload_image
+from .storage import generate_mock_plant_image, upload_image, ImagePipeline, shutdown_image_workers
+from .spool import image_spool, capture_plant_image
+from .jobs import job_manager, Job, JobCancelled
+from .checkpoints import checkpoints, Checkpoint
+from .serialization import MongoJSONResponse, parse_fields
+from .device import device_client, DeviceClient, DeviceUnavailable
 
 __all__ = [
     "cnc", 
-    "grid_positions", 
+    "controllers",
+    "Controller",
+    "grid",
+    "Grid",
+    "load_grid",
     "soil_moisture", 
     "update_soil_moisture_data",
+    "MoistureStore",
+    "plan_route",
+    "route_length",
     "connect_to_mongo",
     "close_mongo_connection",
+    "batch_writer",
     "save_maintenance_cycle",
     "get_maintenance_cycles",
     "save_soil_moisture_reading",
     "get_soil_moisture_history",
     "save_planting_operation",
     "generate_mock_plant_image",
-    "upload_image"
+    "upload_image",
+    "ImagePipeline",
+    "shutdown_image_workers",
+    "image_spool",
+    "capture_plant_image",
+    "replace_image_reference",
+    "job_manager",
+    "Job",
+    "JobCancelled",
+    "checkpoints",
+    "Checkpoint",
+    "MongoJSONResponse",
+    "parse_fields",
+    "device_client",
+    "DeviceClient",
+    "DeviceUnavailable"
 ] 
\ No newline at end of file
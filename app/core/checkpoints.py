@@ -0,0 +1,225 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, UTC
+from typing import Dict, Any, List, Optional, Set, Tuple
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Directory holding the progress journals of unfinished maintenance cycles
+CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR", "checkpoints")
+
+_CYCLE_ID = re.compile(r"[0-9a-f]{32}")
+
+class Checkpoint:
+    """Progress of one sequence run, rebuilt from its journal."""
+
+    def __init__(self, cycle_id: str, header: Dict[str, Any]):
+        self.id = cycle_id
+        self.sequence = header["sequence"]
+        self.controller = header["controller"]
+        self.params = header.get("params", {})
+        self.slots = [tuple(slot) for slot in header["slots"]]
+        self.created_at = header["timestamp"]
+        self.updated_at = header["timestamp"]
+        self.completed: Dict[str, Dict[str, Any]] = {}
+        self.images: List[Dict[str, Any]] = []
+        self.runs = 1
+        # "running" under a job, "unsaved" if MongoDB did not take the result
+        # (kept in `document`), "completed" once saved, otherwise "interrupted"
+        self.status = "interrupted"
+        self.reason = None
+        self.maintenance_id = None
+        self.document = None
+
+    def apply(self, entry: Dict[str, Any]):
+        event = entry["event"]
+        if event == "slot":
+            self.completed[entry["position"]] = entry
+        elif event == "image":
+            self.images.append(entry["image"])
+        elif event == "resume":
+            self.runs += 1
+            self.reason = None
+        elif event == "interrupted":
+            self.reason = entry.get("reason")
+        elif event == "unsaved":
+            self.status = "unsaved"
+            self.document = entry["document"]
+        elif event == "completed":
+            self.status = "completed"
+            self.maintenance_id = entry.get("maintenance_id")
+        self.updated_at = entry.get("timestamp", self.updated_at)
+
+    def remaining(self) -> List[Tuple[int, int]]:
+        """Planned slots not finished yet, in their original order."""
+        return [slot for slot in self.slots if f"{slot[0]},{slot[1]}" not in self.completed]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "cycle_id": self.id,
+            "sequence": self.sequence,
+            "controller": self.controller,
+            "status": self.status,
+            "reason": self.reason,
+            "params": self.params,
+            "completed": len(self.completed),
+            "total": len(self.slots),
+            "runs": self.runs,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**self.summary(), "slots": list(self.completed.values()), "images": self.images}
+
+class CheckpointStore:
+    """Append-only journals that let an interrupted sequence resume where it stopped."""
+
+    def __init__(self, directory: str = CHECKPOINT_DIR):
+        self.directory = directory
+        self._active: Dict[str, Checkpoint] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, cycle_id: str) -> str:
+        return os.path.join(self.directory, cycle_id + ".jsonl")
+
+    def _append(self, cycle_id: str, entry: Dict[str, Any]):
+        line = json.dumps(entry, default=str) + "\n"
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            # Synced before the gantry moves on, so a crash loses at most one slot
+            with open(self._path(cycle_id), "a") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _read(self, cycle_id: str) -> Optional[Checkpoint]:
+        try:
+            with open(self._path(cycle_id)) as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return None
+        checkpoint = None
+        for number, line in enumerate(lines):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A crash mid-write can only tear the last line
+                if number < len(lines) - 1:
+                    logger.error(f"Skipping corrupt line {number + 1} of checkpoint {cycle_id}")
+                continue
+            if checkpoint is None:
+                checkpoint = Checkpoint(cycle_id, entry)
+            else:
+                checkpoint.apply(entry)
+        return checkpoint
+
+    async def create(self, sequence: str, controller_id: str, slots: List[Tuple[int, int]],
+                     params: Optional[Dict[str, Any]] = None) -> Checkpoint:
+        cycle_id = uuid.uuid4().hex
+        header = _entry({"event": "start", "sequence": sequence, "controller": controller_id,
+                         "params": params or {}, "slots": [list(slot) for slot in slots]})
+        await asyncio.to_thread(self._append, cycle_id, header)
+        return Checkpoint(cycle_id, header)
+
+    async def load(self, cycle_id: str) -> Optional[Checkpoint]:
+        """The checkpoint with this ID, or None if there is none."""
+        if cycle_id in self._active:
+            return self._active[cycle_id]
+        if not _CYCLE_ID.fullmatch(cycle_id):
+            return None
+        return await asyncio.to_thread(self._read, cycle_id)
+
+    async def list(self) -> List[Checkpoint]:
+        """Running, interrupted and unsaved checkpoints, most recently updated first."""
+        def read_all():
+            if not os.path.isdir(self.directory):
+                return []
+            names = [name[:-len(".jsonl")] for name in os.listdir(self.directory) if name.endswith(".jsonl")]
+            return [checkpoint for checkpoint in map(self._read, names) if checkpoint]
+
+        checkpoints = {checkpoint.id: checkpoint for checkpoint in await asyncio.to_thread(read_all)}
+        checkpoints.update(self._active)
+        return sorted((checkpoint for checkpoint in checkpoints.values() if checkpoint.status != "completed"),
+                      key=lambda checkpoint: checkpoint.updated_at, reverse=True)
+
+    async def image_references(self) -> Set[str]:
+        """Image URLs or spool references held by checkpoints that are not yet saved."""
+        references = set()
+        for checkpoint in await self.list():
+            references.update(image["url"] for image in checkpoint.images)
+            if checkpoint.document:
+                references.update(checkpoint.document.get("images", []))
+        return references
+
+    async def delete(self, cycle_id: str) -> bool:
+        if cycle_id in self._active or not _CYCLE_ID.fullmatch(cycle_id):
+            return False
+        try:
+            await asyncio.to_thread(os.remove, self._path(cycle_id))
+        except FileNotFoundError:
+            return False
+        return True
+
+    @asynccontextmanager
+    async def running(self, checkpoint: Checkpoint, resume: bool = False):
+        """Mark the checkpoint as running for the duration; an exception records why it stopped."""
+        if checkpoint.id in self._active:
+            raise RuntimeError(f"Cycle {checkpoint.id} is already running")
+        if checkpoint.status in ("completed", "unsaved"):
+            raise RuntimeError(f"Cycle {checkpoint.id} already {checkpoint.status}")
+        if resume:
+            await self._record(checkpoint, {"event": "resume"})
+        self._active[checkpoint.id] = checkpoint
+        checkpoint.status = "running"
+        try:
+            yield checkpoint
+        except BaseException as e:
+            checkpoint.status = "interrupted"
+            # Written without awaiting, as the task may be being cancelled
+            entry = _entry({"event": "interrupted", "reason": str(e) or type(e).__name__})
+            self._append(checkpoint.id, entry)
+            checkpoint.apply(entry)
+            raise
+        finally:
+            self._active.pop(checkpoint.id, None)
+
+    async def record_slot(self, checkpoint: Checkpoint, row: int, col: int, **details):
+        """Persist a finished slot; call once everything at the slot is done."""
+        await self._record(checkpoint, {"event": "slot", "position": f"{row},{col}", "row": row, "col": col,
+                                        **details})
+
+    async def record_image(self, checkpoint: Checkpoint, image: Dict[str, Any]):
+        await self._record(checkpoint, {"event": "image", "image": image})
+
+    async def complete(self, checkpoint: Checkpoint, maintenance_id: str):
+        """Finish the run now that its result is safely in MongoDB, dropping the journal."""
+        await asyncio.to_thread(os.remove, self._path(checkpoint.id))
+        checkpoint.apply(_entry({"event": "completed", "maintenance_id": maintenance_id}))
+
+    async def mark_unsaved(self, checkpoint: Checkpoint, document: Dict[str, Any]):
+        """Keep a finished run's result in the journal because MongoDB did not take it."""
+        # insert_one may have added an ObjectId, which a retry must not reuse
+        document = {key: value for key, value in document.items() if key != "_id"}
+        await self._record(checkpoint, {"event": "unsaved", "document": document})
+
+    async def _record(self, checkpoint: Checkpoint, entry: Dict[str, Any]):
+        entry = _entry(entry)
+        await asyncio.to_thread(self._append, checkpoint.id, entry)
+        checkpoint.apply(entry)
+
+def _entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+    return {**entry, "timestamp": datetime.now(UTC).isoformat()}
+
+# Create a singleton instance
+checkpoints = CheckpointStore()
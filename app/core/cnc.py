@@ -1,68 +1,441 @@
+import asyncio
+import collections
+import concurrent.futures
+import os
 import serial
 import serial.tools.list_ports
 import threading
 import time
+from dotenv import load_dotenv
+from .events import EventBroadcaster
+from .logbuffer import LogBuffer
+from .scheduler import CommandScheduler
+from .metrics import (CNC_COMMAND_SECONDS, CNC_COMMAND_TIMEOUTS, CNC_COMMAND_ERRORS, CNC_PENDING_COMMANDS,
+                      CNC_CONNECTED, CNC_DISCONNECTS, CNC_RECONNECT_SECONDS, EVENT_SUBSCRIBERS)
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Serial device of the controller: empty to auto-detect a USB board, "sim"
+# for the built-in simulated controller, or a device path such as a pty
+CNC_PORT = os.getenv("CNC_PORT", "")
+
+# Seconds between "?" status report requests; 0 disables polling
+STATUS_POLL_INTERVAL = float(os.getenv("CNC_STATUS_POLL_INTERVAL", "0.2"))
+
+# Seconds between connection attempts while the controller is missing
+RECONNECT_INTERVAL = float(os.getenv("CNC_RECONNECT_INTERVAL", "2.0"))
+
+# Longest a wait for motion to finish may take, and how close (mm, per axis)
+# the reported position must be to the target afterwards
+MOTION_TIMEOUT = float(os.getenv("CNC_MOTION_TIMEOUT", "120"))
+POSITION_TOLERANCE = float(os.getenv("CNC_POSITION_TOLERANCE", "0.05"))
+
+# GRBL real-time commands bypass the line buffer and are never acknowledged
+REALTIME_COMMANDS = {"?", "!", "~", "\x18"}
+
+# Jog cancel: drops queued jog motion and decelerates to a stop. It is outside
+# ASCII, so it is written as a raw byte rather than encoded text.
+JOG_CANCEL = b"\x85"
+
+# Size of GRBL's serial receive buffer, used for character-counting flow control
+RX_BUFFER_SIZE = 128
+
+NO_CONNECTION = "Error: No CNC connection."
+TIMEOUT = "Timeout: No response from CNC."
+RESET = "error: controller reset"
 
 class CNCConnection:
-    def __init__(self):
-        self.logs = []
+    """Connection to one GRBL controller; start() connects and reconnects in the background."""
+
+    def __init__(self, port=CNC_PORT, serial_number=None, controller_id="default",
+                 status_poll_interval=STATUS_POLL_INTERVAL, reconnect_interval=RECONNECT_INTERVAL):
+        self.id = controller_id
+        self.events = EventBroadcaster()
+        self.logs = LogBuffer()
         self.position = {"X": 0.0, "Y": 0.0, "Z": 0.0}
-        self.serial_conn = self.connect_serial()
+        self.state = "Unknown"
+        self.port = port
+        self.serial_number = serial_number
+        self.status_poll_interval = status_poll_interval
+        self.reconnect_interval = reconnect_interval
+        self.serial_conn = None
+        # Commands awaiting their ok/error, in the order they were written.
+        # GRBL acknowledges lines strictly in order, so the head of the queue
+        # always owns the next acknowledgement.
+        self._pending = collections.deque()
+        self._write_lock = threading.Lock()
+        # Futures waiting for the next status report
+        self._status_waiters = []
+        self._status_lock = threading.Lock()
+        self._command_seconds = CNC_COMMAND_SECONDS.labels(controller_id)
+        self._timeouts = CNC_COMMAND_TIMEOUTS.labels(controller_id)
+        self._errors = CNC_COMMAND_ERRORS.labels(controller_id)
+        self._disconnects = CNC_DISCONNECTS.labels(controller_id)
+        self._reconnect_seconds = CNC_RECONNECT_SECONDS.labels(controller_id)
+        CNC_PENDING_COMMANDS.set_function(lambda: len(self._pending), controller_id)
+        CNC_CONNECTED.set_function(lambda: int(self.serial_conn is not None), controller_id)
+        EVENT_SUBSCRIBERS.set_function(lambda: self.events.subscriber_count, controller_id)
+        self.scheduler = CommandScheduler(self)
+        # When the connection was lost, while a reconnect is outstanding
+        self._lost_at = None
+        self._supervisor = None
+        self._stopping = threading.Event()
+        self._wake = threading.Event()
+
+    def start(self):
+        """Connect in the background and reconnect whenever the device drops out."""
+        if self._supervisor is None or not self._supervisor.is_alive():
+            self._stopping.clear()
+            self._supervisor = threading.Thread(target=self.supervise, daemon=True)
+            self._supervisor.start()
+
+    def stop(self):
+        """Stop reconnecting and close the port (application shutdown)."""
+        self._stopping.set()
+        self._wake.set()
+        conn = self.serial_conn
+        if conn is not None:
+            self._disconnect(conn, "shutting down")
 
-        if self.serial_conn:
-            threading.Thread(target=self.read_serial, daemon=True).start()
+    def supervise(self):
+        """Open the port whenever it is closed; failures are only logged once per outage."""
+        attempts = 0
+        while not self._stopping.is_set():
+            if self.serial_conn is None:
+                conn = self.connect_serial(quiet=attempts > 0)
+                attempts += 1
+                if conn is not None:
+                    attempts = 0
+                    self._attach(conn)
+            self._wake.wait(self.reconnect_interval)
+            self._wake.clear()
+
+    def _attach(self, conn):
+        with self._write_lock:
+            self.serial_conn = conn
+        if self._lost_at is not None:
+            latency = time.monotonic() - self._lost_at
+            self._lost_at = None
+            self._reconnect_seconds.observe(latency)
+            self.log(f"Reconnected after {latency:.1f}s")
+        threading.Thread(target=self.read_serial, args=(conn,), daemon=True).start()
+        if self.status_poll_interval > 0:
+            threading.Thread(target=self.poll_status, args=(conn,), daemon=True).start()
+
+    def _disconnect(self, conn, reason):
+        """Drop `conn` if it is still the current connection and wake the supervisor."""
+        with self._write_lock:
+            if self.serial_conn is not conn:
+                return
+            self.serial_conn = None
+        try:
+            conn.close()
+        except Exception:
+            pass
+        if not self._stopping.is_set():
+            self._lost_at = time.monotonic()
+            self._disconnects.inc()
+            self.log(f"Connection lost: {reason}", level="error")
+        self._fail_pending(NO_CONNECTION)
+        self.state = "Disconnected"
+        self._resolve_status_waiters()
+        self.events.publish("status", self.status())
+        self._wake.set()
+
+    def connect_serial(self, quiet=False):
+        """Open the configured device, or the first matching USB board; None if there is none."""
+        if self.port == "sim":
+            from .simulator import SimulatedGrbl
+            self.log("Connected to simulated GRBL controller")
+            return SimulatedGrbl()
+        if self.port:
+            try:
+                conn = serial.Serial(self.port, 115200, timeout=1)
+                self.log(f"Connected to {self.port}")
+                return conn
+            except serial.SerialException as e:
+                if not quiet:
+                    self.log(f"Error connecting: {e}", level="error")
+                return None
 
-    def connect_serial(self):
         ports = serial.tools.list_ports.comports()
         for port in ports:
-            if "USB" in port.description:
+            if self.serial_number:
+                # Pinned to one board regardless of which device node it enumerates as
+                matches = port.serial_number == self.serial_number
+            else:
+                matches = "USB" in port.description
+            if matches:
                 try:
                     conn = serial.Serial(port.device, 115200, timeout=1)
                     self.log(f"Connected to {port.device}")
                     return conn
                 except serial.SerialException as e:
-                    self.log(f"Error connecting: {e}")
-        self.log("No CNC device found.")
+                    if not quiet:
+                        self.log(f"Error connecting: {e}", level="error")
+        if quiet:
+            return None
+        if self.serial_number:
+            self.log(f"No CNC device with serial number {self.serial_number} found.", level="error")
+            return None
+        self.log("No CNC device found.", level="error")
         return None
 
-    def send_command_and_wait_response(self, command, timeout=2):
+    def submit(self, command):
+        """Write one line and return a future for its ok/error; raises ValueError for empty or multi-line commands."""
+        if not command.strip() or "\n" in command or "\r" in command:
+            # GRBL acknowledges every line, so each must have its own pending entry
+            raise ValueError(f"Command must be a single non-empty line: {command!r}")
+        future = concurrent.futures.Future()
+        with self._write_lock:
+            conn = self.serial_conn
+            if conn is None:
+                future.set_result(NO_CONNECTION)
+                return future
+            self._pending.append((command, future, time.perf_counter()))
+            error = self._write(conn, (command + "\n").encode())
+        if error:
+            # Resolves this command's future along with everything else pending
+            self._disconnect(conn, f"write failed: {error}")
+            return future
+        self.log(command, direction="TX")
+        return future
+
+    def send_realtime(self, command, quiet=False):
+        """Write a GRBL real-time command; these are never acknowledged."""
+        with self._write_lock:
+            conn = self.serial_conn
+            if conn is None:
+                return
+            error = self._write(conn, command if isinstance(command, bytes) else command.encode())
+        if error:
+            self._disconnect(conn, f"write failed: {error}")
+        elif not quiet:
+            self.log(repr(command), direction="TX")
+
+    @staticmethod
+    def _write(conn, data):
+        """Write to the port, returning the error instead of raising it."""
+        try:
+            conn.write(data)
+        except serial.SerialException as e:
+            return e
+        return None
+
+    def poll_status(self, conn=None):
+        """Request a status report at a fixed rate so position and state stay current."""
+        conn = conn or self.serial_conn
+        while conn is not None and conn is self.serial_conn:
+            self.send_realtime("?", quiet=True)
+            time.sleep(self.status_poll_interval)
+
+    def status(self):
+        return {"state": self.state, "position": self.position}
+
+    def request_status(self):
+        """Ask for a status report and return a future for the state and position it reports."""
+        future = concurrent.futures.Future()
+        with self._status_lock:
+            self._status_waiters.append(future)
+        self.send_realtime("?", quiet=True)
+        return future
+
+    def _resolve_status_waiters(self):
+        with self._status_lock:
+            waiters, self._status_waiters = self._status_waiters, []
+        status = self.status()
+        for future in waiters:
+            if not future.done():
+                future.set_result(status)
+
+    def _check_arrival(self, status, target, tolerance):
+        """'ok' if the machine is Idle and, when given, within `tolerance` of `target` on each axis."""
+        if status["state"] != "Idle":
+            return f"error: machine is {status['state']}"
+        for axis, value in (target or {}).items():
+            if abs(status["position"].get(axis, 0.0) - value) > tolerance:
+                return f"error: {axis} at {status['position'].get(axis, 0.0):g}, expected {value:g}"
+        return "ok"
+
+    async def wait_for_idle(self, target=None, tolerance=POSITION_TOLERANCE, timeout=MOTION_TIMEOUT):
+        """Wait, without blocking the event loop, until queued motion finishes (optionally at `target`)."""
         if not self.serial_conn:
-            return "Error: No CNC connection."
-        
-        self.serial_conn.reset_input_buffer()  # Clear old junk
-        self.serial_conn.write((command + "\n").encode())
-        self.log(f"TX: {command}")
-
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            if self.serial_conn.in_waiting:
-                response = self.serial_conn.readline().decode().strip()
-                self.log(f"RX: {response}")
+            return NO_CONNECTION
+        deadline = time.monotonic() + timeout
+        try:
+            # G4 P0 is only acknowledged once the planner has drained
+            response = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(self.submit("G4 P0"))), timeout)
+            if response != "ok":
                 return response
-            time.sleep(0.1)  # wait 100ms between checks
-        
-        return "Timeout: No response from CNC."
-
-    def read_serial(self):
-        while True:
-            if self.serial_conn and self.serial_conn.in_waiting:
-                response = self.serial_conn.readline().decode().strip()
-                self.log(f"RX: {response}")
-                if "MPos:" in response:
-                    try:
-                        pos_data = response.split("MPos:")[1].split(",")
-                        self.position = {
-                            "X": float(pos_data[0]),
-                            "Y": float(pos_data[1]),
-                            "Z": float(pos_data[2])
-                        }
-                    except Exception as e:
-                        self.log(f"Position error: {e}")
-            time.sleep(0.5)
-
-    def log(self, message):
-        print(message)
-        self.logs.append(message)
-
-# Create a singleton instance
-cnc = CNCConnection() 
\ No newline at end of file
+            # A fresh report confirms Idle and, with `target`, that it is within `tolerance` mm
+            status = await asyncio.wait_for(asyncio.wrap_future(self.request_status()),
+                                            max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            self._timeouts.inc()
+            return TIMEOUT
+        return self._check_arrival(status, target, tolerance)
+
+    async def send_command(self, command, timeout=2):
+        """Send a command and wait, without blocking the event loop, for its ok/error."""
+        if not self.serial_conn:
+            return NO_CONNECTION
+
+        command = command.strip()
+        if command in REALTIME_COMMANDS:
+            self.send_realtime(command)
+            return "ok"
+
+        # Motion is acknowledged once planned, not run; wait_for_idle waits for arrival
+        future = self.submit(command)
+        try:
+            # Shield the future so a timeout here does not cancel it: the
+            # controller still owes an acknowledgement for this line and it
+            # must be consumed by this entry, not by the next command.
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+        except asyncio.TimeoutError:
+            self._timeouts.inc()
+            return TIMEOUT
+
+    async def stream_program(self, program, on_ack=None, timeout=30):
+        """Stream G-code lines with GRBL character counting; returns one result per non-blank line, in order."""
+        # Strip comments and blank lines but keep each line's index in `program`
+        commands = [(index, line.split(";")[0].strip()) for index, line in enumerate(program)]
+        commands = [(index, command) for index, command in commands if command]
+
+        if not self.serial_conn:
+            return [{"line": index, "command": command, "response": NO_CONNECTION, "ok": False}
+                    for index, command in commands]
+
+        # Lines go out while the unacknowledged bytes fit in the RX buffer, so the
+        # planner stays full; on_ack(index, response) sees each ack as it arrives
+        results = {}
+        in_flight = collections.deque()  # (index, command, future, length)
+        buffered = 0
+        aborted = False
+
+        async def ack_oldest():
+            nonlocal buffered, aborted
+            index, command, future, length = in_flight.popleft()
+            ack = asyncio.wrap_future(future)
+            while True:
+                try:
+                    response = await asyncio.wait_for(asyncio.shield(ack), timeout)
+                    break
+                except asyncio.TimeoutError:
+                    # An operator's feed hold can last as long as it needs to
+                    if self.state == "Hold":
+                        continue
+                    # Our count of the controller's buffer is no longer trustworthy
+                    response = TIMEOUT
+                    aborted = True
+                    self._timeouts.inc()
+                    break
+            if response == NO_CONNECTION:
+                aborted = True
+            buffered -= length
+            results[index] = {"line": index, "command": command, "response": response, "ok": response == "ok"}
+            if on_ack:
+                on_ack(index, response)
+
+        for index, command in commands:
+            length = len(command) + 1
+            if "\n" in command or "\r" in command:
+                results[index] = {"line": index, "command": command,
+                                  "response": "error: line contains a line break", "ok": False}
+                continue
+            if length > RX_BUFFER_SIZE:
+                results[index] = {"line": index, "command": command,
+                                  "response": "error: line exceeds RX buffer", "ok": False}
+                continue
+            while in_flight and buffered + length > RX_BUFFER_SIZE and not aborted:
+                await ack_oldest()
+            if aborted:
+                break
+            in_flight.append((index, command, self.submit(command), length))
+            buffered += length
+
+        while in_flight:
+            await ack_oldest()
+
+        return [results.get(index, {"line": index, "command": command, "response": "not sent", "ok": False})
+                for index, command in commands]
+
+    def _resolve(self, response):
+        """Hand an acknowledgement to the oldest outstanding command."""
+        with self._write_lock:
+            if not self._pending:
+                return
+            _, future, sent_at = self._pending.popleft()
+        self._command_seconds.observe(time.perf_counter() - sent_at)
+        if response != "ok":
+            self._errors.inc()
+        if not future.done():
+            future.set_result(response)
+
+    def _fail_pending(self, reason):
+        """Resolve every outstanding command, e.g. after a controller reset."""
+        with self._write_lock:
+            pending, self._pending = self._pending, collections.deque()
+        for _, future, _ in pending:
+            if not future.done():
+                future.set_result(reason)
+
+    def _parse_status(self, response):
+        """Update state and position from a status report such as <Idle|MPos:1.000,2.000,0.000|FS:0,0>."""
+        try:
+            fields = response.strip("<>").split("|")
+            state = fields[0].split(":")[0]
+            position = self.position
+            for field in fields[1:]:
+                if field.startswith("MPos:"):
+                    pos_data = field[len("MPos:"):].split(",")
+                    position = {
+                        "X": float(pos_data[0]),
+                        "Y": float(pos_data[1]),
+                        "Z": float(pos_data[2])
+                    }
+        except Exception as e:
+            self.log(f"Position error: {e}", level="error")
+            return
+
+        # Only push changes so idle machines do not flood subscribers
+        changed = state != self.state or position != self.position
+        self.state = state
+        self.position = position
+        if self._status_waiters:
+            self._resolve_status_waiters()
+        if changed:
+            self.events.publish("status", self.status())
+
+    def read_serial(self, conn=None):
+        """Single reader for the port: routes acknowledgements and status reports."""
+        conn = conn or self.serial_conn
+        while conn is self.serial_conn:
+            try:
+                raw = conn.readline()
+            except serial.SerialException as e:
+                # An unplugged USB device shows up as a failing read
+                self._disconnect(conn, f"read failed: {e}")
+                return
+
+            response = raw.decode(errors="replace").strip()
+            if not response:
+                continue
+
+            if response.startswith("<"):
+                # Status reports arrive several times a second; publish rather than log them
+                self._parse_status(response)
+                continue
+
+            is_error = response.startswith(("error:", "ALARM:"))
+            self.log(response, direction="RX", level="error" if is_error else "info")
+            if response == "ok" or response.startswith("error:"):
+                self._resolve(response)
+            elif response.startswith("Grbl "):
+                # Soft reset: the controller discarded its buffer
+                self._fail_pending(RESET)
+
+    def log(self, message, direction="info", level="info"):
+        entry = self.logs.append(message, direction=direction, level=level)
+        self.events.publish("log", entry)
@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+from typing import Dict, Any, List, Optional
+from dotenv import load_dotenv
+from .cnc import CNCConnection, CNC_PORT
+from .grid import Grid, grid
+from .jog import JogEngine
+from .forecast import DryingModel
+from .moisture import MoistureStore, soil_moisture, update_soil_moisture_data
+
+# Load environment variables from .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Optional JSON file listing the controllers to run (see ControllerRegistry.from_config)
+CNC_CONTROLLERS = os.getenv("CNC_CONTROLLERS")
+
+DEFAULT_CONTROLLER = "default"
+
+class Controller:
+    """One gantry: its CNC connection, the grid it services and that grid's moisture state and model."""
+
+    def __init__(self, controller_id: str, cnc: CNCConnection, grid: Grid, moisture: MoistureStore):
+        self.id = controller_id
+        self.cnc = cnc
+        self.grid = grid
+        self.moisture = moisture
+        self.jog = JogEngine(cnc)
+        self.forecast = DryingModel(moisture)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "port": self.cnc.port or None,
+            "serial_number": self.cnc.serial_number,
+            "online": self.cnc.serial_conn is not None,
+            **self.cnc.status(),
+            "scheduler": self.cnc.scheduler.summary(),
+            "grid": self.grid.summary()
+        }
+
+class ControllerRegistry:
+    """Controllers by ID; the first one is the default for requests that do not pick one."""
+
+    def __init__(self):
+        self._controllers: Dict[str, Controller] = {}
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "ControllerRegistry":
+        """Build the registry from {"controllers": [...]}, as described for CNC_CONTROLLERS in the README."""
+        entries = config["controllers"]
+        ids = [entry["id"] for entry in entries]
+        if not ids or len(set(ids)) != len(ids):
+            raise ValueError(f"Controller ids must be present and unique: {ids}")
+
+        # Resolve every grid before opening any port, so a bad config opens nothing
+        grids = []
+        for entry in entries:
+            grid_config = entry.get("grid")
+            if isinstance(grid_config, dict):
+                grids.append(Grid.from_config(grid_config))
+            elif grid_config:
+                with open(grid_config) as f:
+                    grids.append(Grid.from_config(json.load(f)))
+            else:
+                grids.append(grid)
+
+        registry = cls()
+        for entry, controller_grid in zip(entries, grids):
+            # Pinned by port or USB serial_number; with neither, the first USB device
+            moisture = MoistureStore(controller_grid)
+            update_soil_moisture_data(moisture)
+            cnc = CNCConnection(port=entry.get("port", ""), serial_number=entry.get("serial_number"),
+                                controller_id=entry["id"])
+            registry.add(Controller(entry["id"], cnc, controller_grid, moisture))
+        return registry
+
+    def add(self, controller: Controller):
+        if controller.id in self._controllers:
+            raise ValueError(f"Duplicate controller id: {controller.id}")
+        self._controllers[controller.id] = controller
+
+    @property
+    def default(self) -> Controller:
+        return next(iter(self._controllers.values()))
+
+    def get(self, controller_id: Optional[str] = None) -> Controller:
+        """The controller with this ID, or the default one; raises KeyError for unknown IDs."""
+        if controller_id is None:
+            return self.default
+        return self._controllers[controller_id]
+
+    def select(self, controller_id: Optional[str] = None) -> List[Controller]:
+        """The named controller, or every controller when none is named (for fan-out)."""
+        if controller_id is None:
+            return list(self._controllers.values())
+        return [self.get(controller_id)]
+
+    def all(self) -> List[Controller]:
+        return list(self._controllers.values())
+
+    def start(self):
+        """Start connecting every controller in the background."""
+        for controller in self._controllers.values():
+            controller.cnc.start()
+
+    def stop(self):
+        for controller in self._controllers.values():
+            controller.cnc.stop()
+
+    def __len__(self):
+        return len(self._controllers)
+
+def load_controllers(path: Optional[str] = CNC_CONTROLLERS) -> ControllerRegistry:
+    """Load controllers from the JSON file at `path`, or one on CNC_PORT; raises ValueError if the file is invalid."""
+    if path:
+        try:
+            with open(path) as f:
+                config = json.load(f)
+            registry = ControllerRegistry.from_config(config)
+        except Exception as e:
+            # Stop at startup rather than drive the wrong port
+            raise ValueError(f"Could not load controller config {path}: {e}") from e
+        logger.info(f"Loaded {len(registry)} controllers from {path}")
+        return registry
+    registry = ControllerRegistry()
+    registry.add(Controller(DEFAULT_CONTROLLER, CNCConnection(port=CNC_PORT), grid, soil_moisture))
+    return registry
+
+# Create a singleton instance
+controllers = load_controllers()
+
+# The default controller's connection, for code that drives a single machine
+cnc = controllers.default.cnc
@@ -1,9 +1,14 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+import asyncio
 import os
 from datetime import datetime, UTC
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 import logging
 from dotenv import load_dotenv
+from .serialization import encode_cursor, decode_cursor
+from .metrics import DB_OPERATION_SECONDS, DB_DOCUMENTS_WRITTEN, DB_DOCUMENTS_DROPPED, DB_WRITE_QUEUE_DEPTH
 
 # Load environment variables from .env file
 load_dotenv()
@@ -16,29 +21,179 @@ logger = logging.getLogger(__name__)
 MONGO_URI = os.getenv("MONGO_URI")
 DB_NAME = os.getenv("MONGO_DB_NAME", "agro_bot")
 
+# Rollup collections for soil moisture, by resolution
+MOISTURE_ROLLUPS = {
+    "hour": "soil_moisture_hourly",
+    "day": "soil_moisture_daily"
+}
+
+# Batched writer settings
+WRITE_BATCH_SIZE = int(os.getenv("MONGO_WRITE_BATCH_SIZE", "100"))
+WRITE_FLUSH_INTERVAL = float(os.getenv("MONGO_WRITE_FLUSH_INTERVAL", "1.0"))
+WRITE_QUEUE_SIZE = int(os.getenv("MONGO_WRITE_QUEUE_SIZE", "10000"))
+WRITE_MAX_RETRIES = 3
+
+# Seconds between attempts to prepare the database while MongoDB is unreachable
+MONGO_RETRY_INTERVAL = float(os.getenv("MONGO_RETRY_INTERVAL", "5.0"))
+
 # Initialize MongoDB client
 client = None
 db = None
 
-async def connect_to_mongo():
-    """Connect to MongoDB."""
+class BatchWriter:
+    """Buffers inserts in a bounded queue and writes them with insert_many, per `batch_size` or `flush_interval`."""
+
+    def __init__(self, batch_size: int = WRITE_BATCH_SIZE, flush_interval: float = WRITE_FLUSH_INTERVAL,
+                 queue_size: int = WRITE_QUEUE_SIZE, max_retries: int = WRITE_MAX_RETRIES):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.written = 0
+        self.dropped = 0
+        self._queue = None
+        self._task = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def start(self):
+        if not self.running:
+            self._queue = asyncio.Queue(self.queue_size)
+            self._task = asyncio.create_task(self._run())
+
+    async def put(self, collection: str, document: Dict[str, Any]):
+        if not self.running:
+            logger.error(f"Batch writer not running; dropping {collection} document")
+            self.dropped += 1
+            DB_DOCUMENTS_DROPPED.inc()
+            return
+        # Waits while the queue is full, pushing back on producers when MongoDB is slow
+        await self._queue.put((collection, document))
+
+    async def stop(self):
+        """Flush everything still queued and stop the writer."""
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stopping = False
+            # Flush when full or flush_interval after the first document, whichever comes first
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._write(batch)
+            if stopping:
+                return
+
+    async def _write(self, batch):
+        by_collection = {}
+        for collection, document in batch:
+            by_collection.setdefault(collection, []).append(document)
+
+        for collection, documents in by_collection.items():
+            for attempt in range(self.max_retries + 1):
+                try:
+                    with DB_OPERATION_SECONDS.labels("insert_many", collection).time():
+                        await db[collection].insert_many(documents, ordered=False)
+                    break
+                except BulkWriteError as e:
+                    # insert_many assigns _id client-side, so documents that
+                    # made it in on an earlier attempt come back as duplicates
+                    errors = e.details.get("writeErrors", [])
+                    if all(error.get("code") == 11000 for error in errors):
+                        break
+                    error = e
+                except Exception as e:
+                    error = e
+                if attempt < self.max_retries:
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+            else:
+                logger.error(f"Dropping {len(documents)} {collection} documents after {self.max_retries} retries: {error}")
+                self.dropped += len(documents)
+                DB_DOCUMENTS_DROPPED.inc(len(documents))
+                continue
+            self.written += len(documents)
+            DB_DOCUMENTS_WRITTEN.labels(collection).inc(len(documents))
+
+            after_insert = AFTER_INSERT.get(collection)
+            if after_insert:
+                try:
+                    await after_insert(documents)
+                except Exception as e:
+                    logger.error(f"Error updating derived data for {collection}: {e}")
+
+# Create a singleton instance
+batch_writer = BatchWriter()
+
+DB_WRITE_QUEUE_DEPTH.set_function(lambda: batch_writer.depth)
+
+async def connect_to_mongo(mongo_client=None):
+    """Connect to MongoDB (or use an existing `mongo_client`) and prepare its indexes."""
     global client, db
     try:
-        if not MONGO_URI:
+        # A caller-supplied client stays owned (and closed) by the caller
+        if mongo_client is not None:
+            db = mongo_client[DB_NAME]
+        elif not MONGO_URI:
             logger.warning("MONGO_URI not set in environment variables. MongoDB connection will not be established.")
             return
-            
-        client = AsyncIOMotorClient(MONGO_URI)
-        db = client[DB_NAME]
-        logger.info(f"Connected to MongoDB database: {DB_NAME}")
-        
-        # Create indexes
-        await db.maintenance_cycles.create_index("timestamp")
-        await db.soil_moisture.create_index("timestamp")
-        await db.plant_operations.create_index("timestamp")
-        
+        else:
+            client = AsyncIOMotorClient(MONGO_URI)
+            db = client[DB_NAME]
     except Exception as e:
         logger.error(f"Could not connect to MongoDB: {e}")
+        return
+
+    # Inserts wait and retry in the writer until the server is reachable
+    batch_writer.start()
+    # The client connects lazily, so index creation is what waits for the server
+    while True:
+        try:
+            await _create_indexes()
+            logger.info(f"Connected to MongoDB database: {DB_NAME}")
+            return
+        except Exception as e:
+            logger.error(f"Could not prepare MongoDB, retrying in {MONGO_RETRY_INTERVAL:g}s: {e}")
+            await asyncio.sleep(MONGO_RETRY_INTERVAL)
+
+async def _create_indexes():
+    """Create the indexes the queries rely on; fails if the server is unreachable."""
+    await db.maintenance_cycles.create_index("timestamp")
+    await db.maintenance_cycles.create_index([("timestamp", -1), ("_id", -1)])
+    await db.maintenance_cycles.create_index("images")
+    await db.soil_moisture.create_index("timestamp")
+    await db.soil_moisture.create_index([("position", 1), ("timestamp", -1)])
+    await db.soil_moisture.create_index([("controller", 1), ("position", 1), ("timestamp", -1)])
+    for rollup in MOISTURE_ROLLUPS.values():
+        await db[rollup].create_index([("controller", 1), ("position", 1), ("bucket", -1)], unique=True)
+    await db.plant_operations.create_index("timestamp")
+    await db.plant_operations.create_index([("controller", 1), ("timestamp", -1)])
 
 async def close_mongo_connection():
     """Close MongoDB connection."""
@@ -50,7 +205,7 @@ async def close_mongo_connection():
 # Database operations for maintenance cycles
 async def save_maintenance_cycle(data: Dict[str, Any]) -> str:
     """Save maintenance cycle data to MongoDB."""
-    if not db:
+    if db is None:
         logger.error("Database not initialized")
         return None
     
@@ -59,59 +214,204 @@ async def save_maintenance_cycle(data: Dict[str, Any]) -> str:
         data["timestamp"] = datetime.now(UTC)
     
     try:
-        result = await db.maintenance_cycles.insert_one(data)
+        with DB_OPERATION_SECONDS.labels("insert_one", "maintenance_cycles").time():
+            result = await db.maintenance_cycles.insert_one(data)
         return str(result.inserted_id)
     except Exception as e:
         logger.error(f"Error saving maintenance cycle: {e}")
         return None
 
-async def get_maintenance_cycles(limit: int = 20, skip: int = 0) -> List[Dict[str, Any]]:
-    """Get recent maintenance cycles."""
-    if not db:
+async def get_maintenance_cycles(limit: int = 20, cursor: Optional[str] = None,
+                                 fields: Optional[Dict[str, int]] = None,
+                                 controller: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """One page of maintenance cycles, newest first, and the next cursor (None on the last page)."""
+    if db is None:
         logger.error("Database not initialized")
-        return []
+        return [], None
+    
+    query = {}
+    # Pages are keyed on (timestamp, _id) rather than skipped, so deep pages cost the same;
+    # a bad cursor raises ValueError
+    if cursor:
+        timestamp, object_id = decode_cursor(cursor)
+        query = {"$or": [
+            {"timestamp": {"$lt": timestamp}},
+            {"timestamp": timestamp, "_id": {"$lt": object_id}}
+        ]}
+    if controller is not None:
+        query["controller"] = controller
+    
+    projection = None
+    if fields:
+        # The sort keys are always needed to build the next cursor
+        projection = {**fields, "timestamp": 1, "_id": 1}
     
     try:
-        cursor = db.maintenance_cycles.find().sort("timestamp", -1).skip(skip).limit(limit)
-        return await cursor.to_list(length=limit)
+        # Fetch one extra document to learn whether another page exists
+        find = db.maintenance_cycles.find(query, projection)
+        with DB_OPERATION_SECONDS.labels("find", "maintenance_cycles").time():
+            cycles = await find.sort([("timestamp", -1), ("_id", -1)]).limit(limit + 1).to_list(length=limit + 1)
     except Exception as e:
         logger.error(f"Error retrieving maintenance cycles: {e}")
-        return []
+        return [], None
+    
+    next_cursor = None
+    if len(cycles) > limit:
+        cycles = cycles[:limit]
+        next_cursor = encode_cursor(cycles[-1]["timestamp"], cycles[-1]["_id"])
+    return cycles, next_cursor
+
+async def replace_image_reference(reference: str, url: str) -> int:
+    """Replace a spooled image's local reference with its uploaded URL in maintenance cycles."""
+    if db is None:
+        return 0
+    
+    try:
+        # A reference appears at most once per cycle, so the positional operator is enough
+        with DB_OPERATION_SECONDS.labels("update_many", "maintenance_cycles").time():
+            result = await db.maintenance_cycles.update_many(
+                {"images": reference},
+                {"$set": {"images.$": url}}
+            )
+        return result.modified_count
+    except Exception as e:
+        logger.error(f"Error replacing image reference {reference}: {e}")
+        return 0
 
 # Database operations for soil moisture
-async def save_soil_moisture_reading(data: Dict[str, Any]) -> str:
-    """Save soil moisture reading to MongoDB."""
-    if not db:
+async def save_soil_moisture_reading(data: Dict[str, Any]):
+    """Queue a soil moisture reading for a batched insert into MongoDB."""
+    if db is None:
         logger.error("Database not initialized")
-        return None
+        return
     
     # Add timestamp if not present
     if "timestamp" not in data:
         data["timestamp"] = datetime.now(UTC)
     
-    try:
-        result = await db.soil_moisture.insert_one(data)
-        return str(result.inserted_id)
-    except Exception as e:
-        logger.error(f"Error saving soil moisture reading: {e}")
-        return None
+    await batch_writer.put("soil_moisture", data)
+
+def _bucket(timestamp: datetime, resolution: str) -> datetime:
+    """Start of the hour or day containing `timestamp`."""
+    if resolution == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+async def update_moisture_rollups(readings: List[Dict[str, Any]]):
+    """Fold newly inserted readings into the hourly and daily per-slot rollups."""
+    for resolution, collection in MOISTURE_ROLLUPS.items():
+        # Combine readings that share a bucket so each bucket is one upsert
+        buckets = {}
+        for reading in readings:
+            key = (reading.get("controller"), reading["position"], _bucket(reading["timestamp"], resolution))
+            bucket = buckets.setdefault(key, {
+                "row": reading.get("row"),
+                "col": reading.get("col"),
+                "count": 0,
+                "sum": 0,
+                "min": reading["moisture"],
+                "max": reading["moisture"]
+            })
+            bucket["count"] += 1
+            bucket["sum"] += reading["moisture"]
+            bucket["min"] = min(bucket["min"], reading["moisture"])
+            bucket["max"] = max(bucket["max"], reading["moisture"])
+
+        operations = [
+            UpdateOne(
+                {"controller": controller, "position": position, "bucket": start},
+                {
+                    "$inc": {"count": bucket["count"], "sum": bucket["sum"]},
+                    "$min": {"min": bucket["min"]},
+                    "$max": {"max": bucket["max"]},
+                    "$setOnInsert": {"row": bucket["row"], "col": bucket["col"]}
+                },
+                upsert=True
+            )
+            for (controller, position, start), bucket in buckets.items()
+        ]
+        if operations:
+            with DB_OPERATION_SECONDS.labels("bulk_write", collection).time():
+                await db[collection].bulk_write(operations, ordered=False)
 
 async def get_soil_moisture_history(slot_row: Optional[int] = None, slot_col: Optional[int] = None, 
-                                    limit: int = 50) -> List[Dict[str, Any]]:
-    """Get history of soil moisture readings, optionally filtered by slot."""
-    if not db:
+                                    limit: int = 50, start: Optional[datetime] = None,
+                                    end: Optional[datetime] = None, resolution: str = "raw",
+                                    controller: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Get soil moisture history by controller, slot and time range; an "hour" or "day" `resolution` reads rollups."""
+    if db is None:
         logger.error("Database not initialized")
         return []
     
     query = {}
+    if controller is not None:
+        query["controller"] = controller
     if slot_row is not None and slot_col is not None:
         # Find the specific position
         query["position"] = f"{slot_row},{slot_col}"
     
+    # Rollups hold one document per slot and bucket, so their cost does not grow with the readings
+    time_field = "timestamp" if resolution == "raw" else "bucket"
+    time_range = {}
+    if start is not None:
+        time_range["$gte"] = _bucket(start, resolution) if resolution != "raw" else start
+    if end is not None:
+        time_range["$lte"] = end
+    if time_range:
+        query[time_field] = time_range
+    
     try:
-        cursor = db.soil_moisture.find(query).sort("timestamp", -1).limit(limit)
-        return await cursor.to_list(length=limit)
+        if resolution == "raw":
+            cursor = db.soil_moisture.find(query).sort("timestamp", -1).limit(limit)
+            with DB_OPERATION_SECONDS.labels("find", "soil_moisture").time():
+                return await cursor.to_list(length=limit)
+        
+        collection = MOISTURE_ROLLUPS[resolution]
+        cursor = db[collection].find(query, {"_id": 0}).sort("bucket", -1).limit(limit)
+        with DB_OPERATION_SECONDS.labels("find", collection).time():
+            rollups = await cursor.to_list(length=limit)
+        for rollup in rollups:
+            rollup["mean"] = rollup.pop("sum") / rollup["count"] if rollup["count"] else None
+        return rollups
     except Exception as e:
         logger.error(f"Error retrieving soil moisture history: {e}")
         return []
 
+async def get_moisture_series(controller: str, start: datetime) -> List[Dict[str, Any]]:
+    """Moisture levels of a controller's slots since `start` (row, col, moisture, timestamp), oldest first."""
+    if db is None:
+        return []
+
+    query = {"controller": controller, "timestamp": {"$gte": start}}
+    projection = {"_id": 0, "row": 1, "col": 1, "timestamp": 1}
+    try:
+        with DB_OPERATION_SECONDS.labels("find", "soil_moisture").time():
+            readings = await db.soil_moisture.find(query, {**projection, "moisture": 1}).to_list(length=None)
+        with DB_OPERATION_SECONDS.labels("find", "plant_operations").time():
+            waterings = await db.plant_operations.find({**query, "operation": "watering"},
+                                                       {**projection, "new_moisture": 1}).to_list(length=None)
+    except Exception as e:
+        logger.error(f"Error retrieving moisture series: {e}")
+        return []
+    # The level each watering left behind shows the slot drying out until the next one
+    for watering in waterings:
+        watering["moisture"] = watering.pop("new_moisture")
+    return sorted(readings + waterings, key=lambda entry: entry["timestamp"])
+
+# Database operations for planting and watering operations
+async def save_planting_operation(data: Dict[str, Any]):
+    """Queue a planting or watering operation for a batched insert into MongoDB."""
+    if db is None:
+        logger.error("Database not initialized")
+        return
+    
+    # Add timestamp if not present
+    if "timestamp" not in data:
+        data["timestamp"] = datetime.now(UTC)
+    
+    await batch_writer.put("plant_operations", data)
+
+# Derived data maintained by the batch writer after a successful insert
+AFTER_INSERT = {
+    "soil_moisture": update_moisture_rollups
+}
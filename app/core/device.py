@@ -0,0 +1,71 @@
+import logging
+import os
+import httpx
+from typing import Dict, Optional
+from dotenv import load_dotenv
+from websockets.asyncio.client import unix_connect
+
+# Load environment variables from .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Unix socket of the device daemon. When set, device.py listens on it and
+# main:app becomes a stateless API that forwards hardware calls there.
+DEVICE_SOCKET = os.getenv("DEVICE_SOCKET", "")
+
+# Seconds to wait for the daemon to accept a connection
+DEVICE_CONNECT_TIMEOUT = float(os.getenv("DEVICE_CONNECT_TIMEOUT", "2.0"))
+
+# Headers that belong to one connection rather than the request, so are not forwarded
+HOP_HEADERS = {"connection", "keep-alive", "proxy-connection", "te", "trailer", "transfer-encoding",
+               "upgrade", "host", "content-length"}
+
+class DeviceUnavailable(Exception):
+    """Raised when the device daemon cannot be reached."""
+
+def forwarded_headers(headers) -> Dict[str, str]:
+    return {name: value for name, value in headers.items() if name.lower() not in HOP_HEADERS}
+
+class DeviceClient:
+    """Client of the device daemon, the one process that owns the serial ports."""
+
+    def __init__(self, path: str = DEVICE_SOCKET, connect_timeout: float = DEVICE_CONNECT_TIMEOUT):
+        self.path = path
+        self.connect_timeout = connect_timeout
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def start(self):
+        if self._client is None:
+            # Pooled keep-alive connections; reads never time out, as motion waits and
+            # event streams legitimately stay open
+            self._client = httpx.AsyncClient(
+                transport=httpx.AsyncHTTPTransport(uds=self.path),
+                base_url="http://device",
+                timeout=httpx.Timeout(None, connect=self.connect_timeout)
+            )
+
+    async def stop(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def send(self, method: str, path: str, query: str = "", headers=None, body: bytes = b"") -> httpx.Response:
+        """Forward a request and return the daemon's response with its body still streaming; aclose() it when done."""
+        self.start()
+        url = httpx.URL(path=path, query=query.encode())
+        request = self._client.build_request(method, url, headers=forwarded_headers(headers or {}), content=body)
+        try:
+            # Streamed, so SSE and long `wait=true` calls behave as in a single process
+            return await self._client.send(request, stream=True)
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError) as e:
+            logger.error(f"Device daemon at {self.path} unavailable: {e}")
+            raise DeviceUnavailable(str(e)) from e
+
+    def websocket(self, path: str, query: str = ""):
+        """Open a WebSocket to the daemon; use as `async with client.websocket(...) as ws`."""
+        uri = f"ws://device{path}" + (f"?{query}" if query else "")
+        return unix_connect(self.path, uri=uri, open_timeout=self.connect_timeout)
+
+# Create a singleton instance
+device_client = DeviceClient()
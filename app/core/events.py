@@ -0,0 +1,56 @@
+import asyncio
+import json
+from datetime import datetime, UTC
+from typing import Dict, Any
+
+# Events buffered per subscriber before the oldest are dropped for a slow client
+SUBSCRIBER_QUEUE_SIZE = 100
+
+class EventBroadcaster:
+    """Fans machine events out to any number of async subscribers; publish() may be called from any thread."""
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._loop = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event_type: str, data: Dict[str, Any]):
+        if not self._subscribers or self._loop is None:
+            return
+
+        # Serialized once and shared, so an update costs the same however many dashboards listen
+        message = json.dumps({"type": event_type, "timestamp": datetime.now(UTC).isoformat(), **data}, default=str)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        if running is self._loop:
+            self._deliver(message)
+        else:
+            try:
+                self._loop.call_soon_threadsafe(self._deliver, message)
+            except RuntimeError:
+                # The event loop has shut down
+                pass
+
+    def _deliver(self, message: str):
+        for queue in list(self._subscribers):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+    async def subscribe(self):
+        """Yield serialized events until the consumer stops iterating."""
+        self._loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(self.queue_size)
+        self._subscribers.add(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._subscribers.discard(queue)
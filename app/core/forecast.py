@@ -0,0 +1,180 @@
+import logging
+import os
+import time
+import numpy as np
+from datetime import datetime, UTC
+from typing import Dict, Any, List, Optional, Tuple
+from dotenv import load_dotenv
+from .database import get_moisture_series
+from .moisture import MoistureStore
+
+# Load environment variables from .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Hours of moisture history the drying rates are fitted from
+MOISTURE_MODEL_WINDOW = float(os.getenv("MOISTURE_MODEL_WINDOW", "72"))
+# Standard deviations of drying-rate spread allowed for when ruling a slot out;
+# higher skips fewer slots
+MOISTURE_MODEL_Z = float(os.getenv("MOISTURE_MODEL_Z", "2.0"))
+# Hours between full sweeps that sense every slot regardless of the model
+MOISTURE_SWEEP_INTERVAL = float(os.getenv("MOISTURE_SWEEP_INTERVAL", "24"))
+# Seconds a fitted model is reused before calibrate() refits it
+MOISTURE_MODEL_REFIT = float(os.getenv("MOISTURE_MODEL_REFIT", "600"))
+# Seconds of history read again on each refit, for readings the batch writer stored late
+REFIT_OVERLAP = 300
+# Drying intervals a slot needs before its own rate counts as much as the grid-wide one
+PRIOR_WEIGHT = 3
+# Drying intervals across the grid needed before any slot is skipped
+MIN_INTERVALS = 5
+
+def _epoch(timestamp) -> float:
+    if isinstance(timestamp, datetime):
+        # MongoDB returns naive datetimes in UTC
+        return (timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=UTC)).timestamp()
+    return float(timestamp)
+
+class DryingModel:
+    """Predicts each slot's moisture from its last level and how fast it dries out."""
+
+    def __init__(self, store: MoistureStore, z: float = MOISTURE_MODEL_Z,
+                 sweep_interval: float = MOISTURE_SWEEP_INTERVAL, window: float = MOISTURE_MODEL_WINDOW,
+                 refit_interval: float = MOISTURE_MODEL_REFIT):
+        self.store = store
+        self.z = z
+        self.sweep_interval = sweep_interval
+        self.window = window
+        self.refit_interval = refit_interval
+        size = len(store)
+        # Drying rate and its spread in moisture points per hour
+        self.rates = np.full(size, np.nan)
+        self.spread = np.full(size, np.nan)
+        self.intervals = np.zeros(size, dtype=int)
+        self.pooled_rate = None
+        self.calibrated_at = None
+        self.last_full_sweep = None
+        # History from MongoDB as (slot index, timestamp, moisture) arrays, read up to _read_until
+        self._series = (np.empty(0, dtype=int), np.empty(0), np.empty(0))
+        self._read_until = None
+
+    @property
+    def calibrated(self) -> bool:
+        return self.calibrated_at is not None and int(self.intervals.sum()) >= MIN_INTERVALS
+
+    def fit(self, indices: np.ndarray, times: np.ndarray, values: np.ndarray):
+        """Fit drying rates from flat arrays of (slot index, timestamp, moisture)."""
+        size = len(self.store)
+        order = np.lexsort((times, indices))
+        indices, times, values = indices[order], times[order], values[order]
+        hours = np.diff(times) / 3600.0
+        loss = -np.diff(values)
+        # Waterings (and rain) raise the level, splitting a slot's history into drying intervals
+        drying = (indices[1:] == indices[:-1]) & (hours > 0) & (loss >= 0)
+        slot, hours, loss = indices[1:][drying], hours[drying], loss[drying]
+
+        # Rates are time-weighted, so a long interval counts for more than a short one
+        counts = np.bincount(slot, minlength=size)
+        slot_hours = np.bincount(slot, weights=hours, minlength=size)
+        slot_loss = np.bincount(slot, weights=loss, minlength=size)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            slot_rate = slot_loss / slot_hours
+            deviation = loss / hours - slot_rate[slot]
+            slot_var = np.bincount(slot, weights=hours * deviation ** 2, minlength=size) / slot_hours
+        if hours.sum() > 0:
+            pooled = loss.sum() / hours.sum()
+            pooled_var = (hours * (loss / hours - pooled) ** 2).sum() / hours.sum()
+        else:
+            pooled, pooled_var = np.nan, np.nan
+
+        # Blend with the grid-wide rate until a slot has PRIOR_WEIGHT intervals of its own
+        weight = counts / (counts + PRIOR_WEIGHT)
+        self.rates = np.where(counts > 0, weight * np.nan_to_num(slot_rate) + (1 - weight) * pooled, pooled)
+        self.spread = np.sqrt(np.where(counts > 0, weight * np.nan_to_num(slot_var) + (1 - weight) * pooled_var,
+                                       pooled_var))
+        self.intervals = counts
+        self.pooled_rate = None if np.isnan(pooled) else float(pooled)
+        self.calibrated_at = time.time()
+
+    async def calibrate(self, controller_id: str, force: bool = False):
+        """Refit from the controller's history in MongoDB, or from memory when there is none."""
+        now = time.time()
+        # A fit is reused for `refit_interval` seconds
+        if not force and self.calibrated_at is not None and now - self.calibrated_at < self.refit_interval:
+            return
+        window_start = now - self.window * 3600
+        # Only read what MongoDB gained since the last refit
+        start = window_start if self._read_until is None else max(window_start, self._read_until - REFIT_OVERLAP)
+        series = await get_moisture_series(controller_id, datetime.fromtimestamp(start, UTC))
+        grid = self.store.grid
+        series = [entry for entry in series if (entry.get("row"), entry.get("col")) in grid]
+
+        # Keep cached history inside the window and before what was just read again
+        indices, times, values = self._series
+        keep = (times >= window_start) & (times < start)
+        if series:
+            indices = np.concatenate([indices[keep], grid.indices([(entry["row"], entry["col"]) for entry in series])])
+            times = np.concatenate([times[keep], [_epoch(entry["timestamp"]) for entry in series]])
+            values = np.concatenate([values[keep], np.array([entry["moisture"] for entry in series], dtype=float)])
+        else:
+            indices, times, values = indices[keep], times[keep], values[keep]
+        self._series = (indices, times, values)
+        self._read_until = now
+
+        if len(times):
+            self.fit(indices, times, values)
+        else:
+            self.fit(*self.store.readings())
+
+    def predict(self, now: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Expected moisture of every slot now and its lower confidence bound; NaN where unknown."""
+        now = time.time() if now is None else now
+        values, times = self.store.latest()
+        hours = np.maximum(0.0, (now - times) / 3600.0)
+        expected = np.clip(values - self.rates * hours, 0, 100)
+        # As if drying `z` standard deviations faster than expected
+        lower = np.clip(values - (self.rates + self.z * self.spread) * hours, 0, 100)
+        return expected, lower
+
+    def candidates(self, threshold: float, now: Optional[float] = None) -> List[Tuple[int, int]]:
+        """Slots that might be below `threshold`: all of them until the model is calibrated."""
+        if not self.calibrated:
+            return self.store.grid.slots()
+        _, lower = self.predict(now)
+        # Unknown slots have a NaN bound, which must count as possibly dry
+        possibly_dry = ~(lower >= threshold)
+        return [self.store.grid.slot(index) for index in np.flatnonzero(possibly_dry)]
+
+    def sweep_due(self, now: Optional[float] = None) -> bool:
+        # Full sweeps keep the fit getting fresh intervals from every slot
+        now = time.time() if now is None else now
+        return self.last_full_sweep is None or now - self.last_full_sweep >= self.sweep_interval * 3600
+
+    def record_sweep(self, timestamp: Optional[float] = None):
+        """Note that every slot was just sensed."""
+        self.last_full_sweep = time.time() if timestamp is None else timestamp
+
+    def summary(self, threshold: Optional[float] = None) -> Dict[str, Any]:
+        """Model state and per-slot predictions as rows x cols matrices, null where unknown."""
+        grid = self.store.grid
+        expected, lower = self.predict()
+
+        def matrix(values):
+            values = np.round(values, 2).reshape(grid.rows, grid.cols).tolist()
+            return [[None if np.isnan(value) else value for value in row] for row in values]
+
+        summary = {
+            "calibrated": self.calibrated,
+            "calibrated_at": self.calibrated_at,
+            "drying_intervals": int(self.intervals.sum()),
+            "pooled_rate_per_hour": self.pooled_rate,
+            "last_full_sweep": self.last_full_sweep,
+            "sweep_due": self.sweep_due(),
+            "rate_per_hour": matrix(self.rates),
+            "expected": matrix(expected),
+            "lower_bound": matrix(lower)
+        }
+        if threshold is not None:
+            summary["threshold"] = threshold
+            summary["candidates"] = [(row+1, col+1) for row, col in self.candidates(threshold)]
+        return summary
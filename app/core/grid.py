@@ -1,18 +1,164 @@
-import random
+import json
+import logging
+import os
+import numpy as np
+from typing import Dict, Any, List, Optional, Tuple
+from dotenv import load_dotenv
 
-# --- Planting Grid Positions ---
-grid_positions = {
+# Load environment variables from .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Optional JSON file describing the grid layout (see Grid.from_config)
+GRID_CONFIG = os.getenv("GRID_CONFIG")
+
+AXES = ("X", "Y", "Z")
+
+# --- Default Planting Grid Positions ---
+DEFAULT_POSITIONS = {
     (0, 0): "X3 Y2", (0, 1): "X3 Y9", (0, 2): "X3 Y15 Z-50",
     (1, 0): "X20 Y2", (1, 1): "X20 Y9", (1, 2): "X20 Y15",
     (2, 0): "X38 Y2", (2, 1): "X38 Y9", (2, 2): "X38 Y15"
 }
 
-# Initialize soil moisture with random values
-soil_moisture = {(row, col): random.randint(20, 80) for row in range(3) for col in range(3)}
+def parse_position(pos: str) -> List[float]:
+    """Parse a G-code position such as "X3 Y15 Z-50" into [x, y, z]; missing axes are NaN."""
+    values = {word[0].upper(): float(word[1:]) for word in pos.split()}
+    return [values.get(axis, np.nan) for axis in AXES]
+
+class Grid:
+    """Rows x cols slot layout with coordinates held in a numeric array."""
+
+    def __init__(self, coordinates: np.ndarray, limits: Optional[Dict[str, List[float]]] = None):
+        coordinates = np.asarray(coordinates, dtype=float)
+        if coordinates.ndim != 3 or coordinates.shape[2] != len(AXES):
+            raise ValueError("Grid coordinates must have shape (rows, cols, 3)")
+        self.rows, self.cols = coordinates.shape[:2]
+        # Row-major slot order, NaN where a slot does not command an axis
+        self.coords = coordinates.reshape(-1, len(AXES))
+        self.xy = self.coords[:, :2]
+        self._gcode = [
+            " ".join(f"{axis}{value:g}" for axis, value in zip(AXES, point) if not np.isnan(value))
+            for point in self.coords
+        ]
+
+        if limits:
+            outside = self.out_of_bounds(limits)
+            if outside:
+                logger.error(f"{len(outside)} grid slots lie outside the machine limits, e.g. {outside[:5]}")
+
+    @classmethod
+    def from_positions(cls, positions: Dict[Tuple[int, int], str], **kwargs) -> "Grid":
+        """Build a grid from {(row, col): "X.. Y.. [Z..]"} G-code positions."""
+        rows = max(row for row, _ in positions) + 1
+        cols = max(col for _, col in positions) + 1
+        coordinates = np.full((rows, cols, len(AXES)), np.nan)
+        for (row, col), pos in positions.items():
+            coordinates[row, col] = parse_position(pos)
+        return cls(coordinates, **kwargs)
+
+    @classmethod
+    def from_pitch(cls, rows: int, cols: int, origin: Dict[str, float], pitch: Dict[str, float],
+                   z: Optional[float] = None, **kwargs) -> "Grid":
+        """Generate a regular layout: rows advance along X and columns along Y, as in the default grid."""
+        coordinates = np.full((rows, cols, len(AXES)), np.nan)
+        coordinates[:, :, 0] = origin.get("X", 0.0) + np.arange(rows)[:, None] * pitch.get("X", 0.0)
+        coordinates[:, :, 1] = origin.get("Y", 0.0) + np.arange(cols)[None, :] * pitch.get("Y", 0.0)
+        if z is not None:
+            coordinates[:, :, 2] = z
+        return cls(coordinates, **kwargs)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "Grid":
+        """Build a grid from explicit "positions" or a "rows"/"cols"/"origin"/"pitch" layout, with optional "limits"."""
+        limits = config.get("limits")
+        if "positions" in config:
+            positions = {(row, col): pos
+                         for row, line in enumerate(config["positions"])
+                         for col, pos in enumerate(line)}
+            return cls.from_positions(positions, limits=limits)
+        return cls.from_pitch(config["rows"], config["cols"], config.get("origin", {}),
+                              config["pitch"], z=config.get("z"), limits=limits)
+
+    def __len__(self) -> int:
+        return self.rows * self.cols
+
+    def __contains__(self, slot) -> bool:
+        row, col = slot
+        return 0 <= row < self.rows and 0 <= col < self.cols
+
+    def index(self, row: int, col: int) -> int:
+        """Position of a slot in the coordinate arrays."""
+        return row * self.cols + col
+
+    def slot(self, index: int) -> Tuple[int, int]:
+        return divmod(int(index), self.cols)
+
+    def slots(self) -> List[Tuple[int, int]]:
+        """Every slot in row-major order."""
+        return [(row, col) for row in range(self.rows) for col in range(self.cols)]
+
+    def indices(self, slots) -> np.ndarray:
+        slots = np.asarray(list(slots), dtype=int).reshape(-1, 2)
+        return slots[:, 0] * self.cols + slots[:, 1]
+
+    def gcode(self, row: int, col: int) -> Optional[str]:
+        """G-code position words for a slot, e.g. "X3 Y15 Z-50"; None if the slot does not exist."""
+        if (row, col) not in self:
+            return None
+        return self._gcode[self.index(row, col)] or None
+
+    def coordinates(self, row: int, col: int) -> Optional[Dict[str, float]]:
+        if (row, col) not in self:
+            return None
+        point = self.coords[self.index(row, col)]
+        return {axis: float(value) for axis, value in zip(AXES, point) if not np.isnan(value)}
+
+    def distance_matrix(self, slots=None) -> np.ndarray:
+        """Pairwise XY distances between slots (all slots when None)."""
+        xy = self.xy if slots is None else self.xy[self.indices(slots)]
+        delta = xy[:, None, :] - xy[None, :, :]
+        return np.hypot(delta[..., 0], delta[..., 1])
+
+    def distances_from(self, x: float, y: float, slots=None) -> np.ndarray:
+        """XY distance from a point to each slot (all slots when None)."""
+        xy = self.xy if slots is None else self.xy[self.indices(slots)]
+        return np.hypot(xy[:, 0] - x, xy[:, 1] - y)
+
+    def bounds(self) -> Dict[str, List[float]]:
+        """[min, max] of each axis over all slots, for the axes the grid commands."""
+        bounds = {}
+        for i, axis in enumerate(AXES):
+            values = self.coords[:, i]
+            if not np.all(np.isnan(values)):
+                bounds[axis] = [float(np.nanmin(values)), float(np.nanmax(values))]
+        return bounds
+
+    def out_of_bounds(self, limits: Dict[str, List[float]]) -> List[Tuple[int, int]]:
+        """Slots with any commanded axis outside [min, max] in `limits`."""
+        outside = np.zeros(len(self), dtype=bool)
+        for i, axis in enumerate(AXES):
+            if axis in limits:
+                low, high = limits[axis]
+                values = self.coords[:, i]
+                outside |= ~np.isnan(values) & ((values < low) | (values > high))
+        return [self.slot(index) for index in np.flatnonzero(outside)]
+
+    def summary(self) -> Dict[str, Any]:
+        return {"rows": self.rows, "cols": self.cols, "slots": len(self), "bounds": self.bounds()}
+
+def load_grid(path: Optional[str] = GRID_CONFIG) -> Grid:
+    """Load the grid from the JSON file at `path`, or the default 3x3 layout; raises ValueError if it is invalid."""
+    if path:
+        try:
+            with open(path) as f:
+                grid = Grid.from_config(json.load(f))
+        except Exception as e:
+            raise ValueError(f"Could not load grid config {path}: {e}") from e
+        logger.info(f"Loaded {grid.rows}x{grid.cols} grid from {path}")
+        return grid
+    return Grid.from_positions(DEFAULT_POSITIONS)
 
-def update_soil_moisture_data():
-    """Update all soil moisture values with random data (for simulation)"""
-    for row in range(3):
-        for col in range(3):
-            soil_moisture[(row, col)] = random.randint(20, 80)
-    return soil_moisture 
\ No newline at end of file
+# Create a singleton instance
+grid = load_grid()
@@ -0,0 +1,178 @@
+import asyncio
+import collections
+import logging
+import traceback
+import uuid
+from datetime import datetime, UTC
+from typing import Dict, Any, List, Optional
+from .metrics import JOB_QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+# How many finished jobs to keep for status queries
+JOB_HISTORY_SIZE = 100
+
+# Lane for jobs submitted without a controller
+DEFAULT_LANE = "default"
+
+class JobCancelled(Exception):
+    """Raised inside a running job at a safe point once cancellation is requested."""
+
+class Job:
+    def __init__(self, name: str, func, args, kwargs, lane: str = DEFAULT_LANE):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.lane = lane
+        self.status = "queued"
+        self.created_at = datetime.now(UTC)
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.progress = {"completed": 0, "total": None, "current": None, "slots": []}
+        self.cancel_requested = False
+        self._cancel_callbacks = []
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+        self._done = asyncio.Event()
+
+    def set_total(self, total: int):
+        self.progress["total"] = total
+
+    def report_slot(self, row: int, col: int, **details):
+        """Record a finished slot; this is also the job's cancellation point."""
+        self.progress["completed"] += 1
+        self.progress["current"] = (row+1, col+1)
+        self.progress["slots"].append({"position": (row+1, col+1), "finished_at": datetime.now(UTC), **details})
+        self.check_cancelled()
+
+    def request_cancel(self):
+        """Ask the job to stop at its next safe point and wake anything it is waiting on."""
+        self.cancel_requested = True
+        for callback in list(self._cancel_callbacks):
+            callback()
+
+    def add_cancel_callback(self, callback):
+        self._cancel_callbacks.append(callback)
+
+    def remove_cancel_callback(self, callback):
+        self._cancel_callbacks.remove(callback)
+
+    def check_cancelled(self):
+        if self.cancel_requested:
+            raise JobCancelled(f"Job {self.id} cancelled")
+
+    async def wait(self):
+        await self._done.wait()
+
+    def to_dict(self, include_result: bool = False) -> Dict[str, Any]:
+        data = {
+            "job_id": self.id,
+            "name": self.name,
+            "controller": self.lane,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": {key: value for key, value in self.progress.items() if key != "slots"},
+            "error": self.error
+        }
+        if include_result:
+            data["result"] = self.result
+        return data
+
+class JobManager:
+    """Runs submitted jobs one at a time per lane, so only one sequence drives each CNC."""
+
+    def __init__(self, history: int = JOB_HISTORY_SIZE):
+        self.jobs: Dict[str, Job] = collections.OrderedDict()
+        self.history = history
+        # Each controller is a lane with its own queue and worker, so gantries run in parallel
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        self.current: Dict[str, Job] = {}
+
+    def submit(self, name: str, func, *args, lane: str = DEFAULT_LANE, **kwargs) -> Job:
+        """Queue `func(job, *args, **kwargs)` on `lane` and return its job immediately."""
+        self._ensure_worker(lane)
+        job = Job(name, func, args, kwargs, lane=lane)
+        self.jobs[job.id] = job
+        self._queues[lane].put_nowait(job)
+        self._trim()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        return list(reversed(self.jobs.values()))
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a queued job outright, or ask a running one to stop at its next safe point."""
+        job = self.jobs.get(job_id)
+        if not job or job.status not in ("queued", "running"):
+            return job
+        job.request_cancel()
+        if job.status == "queued":
+            self._finish(job, "cancelled")
+        return job
+
+    async def stop(self):
+        """Cancel outstanding work and stop the worker (application shutdown)."""
+        for job in list(self.jobs.values()):
+            self.cancel(job.id)
+        for lane, worker in list(self._workers.items()):
+            worker.cancel()
+            try:
+                await worker
+            except asyncio.CancelledError:
+                pass
+            del self._workers[lane]
+
+    def _ensure_worker(self, lane: str):
+        worker = self._workers.get(lane)
+        if worker is None or worker.done():
+            self._queues.setdefault(lane, asyncio.Queue())
+            self._workers[lane] = asyncio.create_task(self._run(lane))
+
+    async def _run(self, lane: str):
+        queue = self._queues[lane]
+        while True:
+            job = await queue.get()
+            if job.status != "queued":
+                continue
+
+            self.current[lane] = job
+            job.status = "running"
+            job.started_at = datetime.now(UTC)
+            try:
+                job.result = await job._func(job, *job._args, **job._kwargs)
+                self._finish(job, "completed")
+            except JobCancelled:
+                self._finish(job, "cancelled")
+            except asyncio.CancelledError:
+                self._finish(job, "cancelled")
+                raise
+            except Exception as e:
+                logger.error(f"Job {job.id} ({job.name}) failed: {e}\n{traceback.format_exc()}")
+                job.error = str(e)
+                self._finish(job, "failed")
+            finally:
+                self.current.pop(lane, None)
+
+    def _finish(self, job: Job, status: str):
+        job.status = status
+        job.finished_at = datetime.now(UTC)
+        job._done.set()
+
+    def _trim(self):
+        """Forget the oldest finished jobs beyond the history size."""
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished_at]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[job_id]
+
+# Create a singleton instance
+job_manager = JobManager()
+
+JOB_QUEUE_DEPTH.set_function(lambda: sum(job.status == "queued" for job in job_manager.jobs.values()))
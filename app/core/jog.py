@@ -0,0 +1,153 @@
+import asyncio
+import math
+import os
+import time
+from typing import Dict, Any, Optional
+from dotenv import load_dotenv
+from .cnc import CNCConnection, JOG_CANCEL, MOTION_TIMEOUT, NO_CONNECTION, TIMEOUT
+from .grid import AXES
+from .metrics import CNC_JOG_REQUESTS, CNC_JOG_COMMANDS, CNC_JOG_CLAMPED
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Seconds over which jog requests are merged into one motion
+JOG_WINDOW = float(os.getenv("CNC_JOG_WINDOW", "0.05"))
+# Feed rate (mm/min) for jogs that do not give one
+JOG_FEED_RATE = float(os.getenv("CNC_JOG_FEED_RATE", "1000"))
+# Most jog travel (mm) that may be queued ahead of the head; requests beyond it are cut short
+JOG_MAX_OUTSTANDING = float(os.getenv("CNC_JOG_MAX_OUTSTANDING", "10"))
+
+def parse_jog(direction: str) -> Dict[str, float]:
+    """Axis deltas of a relative jog such as "X10" or "X-2.5 Y1"; raises ValueError if malformed."""
+    deltas = {}
+    for word in direction.upper().split():
+        axis, value = word[0], float(word[1:])
+        if axis not in AXES or not math.isfinite(value):
+            raise ValueError(f"Invalid jog word: {word}")
+        deltas[axis] = deltas.get(axis, 0.0) + value
+    if not deltas:
+        raise ValueError("Jog needs at least one axis")
+    return deltas
+
+class JogEngine:
+    """Turns a stream of small jog requests into few GRBL `$J=` jog motions."""
+
+    def __init__(self, cnc: CNCConnection, window: float = JOG_WINDOW, feed_rate: float = JOG_FEED_RATE,
+                 max_outstanding: float = JOG_MAX_OUTSTANDING):
+        self.cnc = cnc
+        self.window = window
+        self.feed_rate = feed_rate
+        self.max_outstanding = max_outstanding
+        # Requests within `window` of each other are summed per axis into one jog
+        self._pending: Dict[str, float] = {}
+        self._feed = None
+        self._requests = 0
+        self._batch = None
+        self._flusher = None
+        # Where the head will be once every jog sent so far has run
+        self._target = None
+        self._last_sent = 0.0
+        self._request_count = CNC_JOG_REQUESTS.labels(cnc.id)
+        self._command_count = CNC_JOG_COMMANDS.labels(cnc.id)
+        self._clamped = CNC_JOG_CLAMPED.labels(cnc.id)
+
+    async def jog(self, deltas: Dict[str, float], feed: Optional[float] = None) -> Dict[str, Any]:
+        """Queue a relative move; returns once the jog it was merged into has been sent."""
+        self._request_count.inc()
+        for axis, delta in deltas.items():
+            self._pending[axis] = self._pending.get(axis, 0.0) + delta
+        if feed:
+            self._feed = feed
+        if self._batch is None:
+            self._batch = asyncio.get_running_loop().create_future()
+            self._requests = 0
+        self._requests += 1
+        batch = self._batch
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush())
+        return await asyncio.shield(batch)
+
+    def cancel(self):
+        """Stop jogging now (jog cancel, 0x85) and forget jogs not yet sent."""
+        self._pending = {}
+        self._target = None
+        self.cnc.scheduler.realtime(JOG_CANCEL)
+
+    async def wait_for_stop(self, timeout: float = MOTION_TIMEOUT) -> str:
+        """Wait until the jog motion has run out: "ok" once the machine is Idle."""
+        if not self.cnc.serial_conn:
+            return NO_CONNECTION
+        deadline = time.monotonic() + timeout
+        # Poll status rather than send G4 P0: GRBL only takes jog commands while jogging
+        while time.monotonic() < deadline:
+            try:
+                status = await asyncio.wait_for(asyncio.wrap_future(self.cnc.request_status()),
+                                                max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                break
+            if status["state"] == "Idle":
+                return "ok"
+            if status["state"] != "Jog":
+                return f"error: machine is {status['state']}"
+            await asyncio.sleep(self.cnc.status_poll_interval or self.window)
+        return TIMEOUT
+
+    async def _flush(self):
+        while self._batch is not None:
+            await asyncio.sleep(self.window)
+            # Requests arriving from here on start the next batch
+            batch, self._batch = self._batch, None
+            pending, self._pending = self._pending, {}
+            feed, self._feed = self._feed or self.feed_rate, None
+            merged = self._requests
+            try:
+                result = await self._send(pending, feed)
+                batch.set_result({**result, "merged": merged})
+            except Exception as e:
+                batch.set_exception(e)
+
+    async def _send(self, pending: Dict[str, float], feed: float) -> Dict[str, Any]:
+        cnc = self.cnc
+        if not cnc.serial_conn:
+            return {"response": NO_CONNECTION, "sent": None, "clamped": False}
+
+        # Wait for the sequence's safe point before judging state and position
+        async with cnc.scheduler.interactive():
+            if cnc.state not in ("Idle", "Jog"):
+                # The last report may predate the end of the sequence's unit
+                try:
+                    await asyncio.wait_for(asyncio.wrap_future(cnc.request_status()), self.window + 1.0)
+                except asyncio.TimeoutError:
+                    pass
+            if cnc.state not in ("Idle", "Jog"):
+                return {"response": f"error: machine is {cnc.state}", "sent": None, "clamped": False}
+
+            position = cnc.position
+            # A status report may not show a jog that was just acknowledged yet
+            settled = time.monotonic() - self._last_sent > 2 * max(cnc.status_poll_interval, self.window)
+            if self._target is None or (cnc.state == "Idle" and settled):
+                self._target = dict(position)
+            outstanding = math.dist([self._target.get(axis, 0.0) for axis in AXES],
+                                    [position.get(axis, 0.0) for axis in AXES])
+            length = math.hypot(*pending.values()) if pending else 0.0
+            if length == 0:
+                return {"response": "ok", "sent": None, "clamped": False}
+
+            # Shorten the jog so the head stays within `max_outstanding` mm of the input
+            scale = min(1.0, max(0.0, self.max_outstanding - outstanding) / length)
+            if scale < 1:
+                self._clamped.inc()
+            move = {axis: delta * scale for axis, delta in pending.items() if abs(delta * scale) >= 0.001}
+            if not move:
+                return {"response": "ok", "sent": None, "clamped": True}
+
+            # `$J=` jogs leave the G90/G91 mode of later sequences alone
+            command = "$J=G91 G21 " + " ".join(f"{axis}{value:.3f}" for axis, value in move.items()) + f" F{feed:g}"
+            response = await cnc.send_command(command)
+        self._command_count.inc()
+        if response == "ok":
+            self._last_sent = time.monotonic()
+            for axis, value in move.items():
+                self._target[axis] = self._target.get(axis, 0.0) + value
+        return {"response": response, "sent": command, "clamped": scale < 1}
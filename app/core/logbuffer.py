@@ -0,0 +1,90 @@
+import collections
+import itertools
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Number of log entries kept in memory
+LOG_CAPACITY = int(os.getenv("CNC_LOG_CAPACITY", "5000"))
+# Echo log entries to the console
+LOG_CONSOLE = os.getenv("CNC_LOG_CONSOLE", "1").lower() not in ("0", "false", "no")
+
+_console_logger = logging.getLogger("cnc")
+_console_listener = None
+
+def _console():
+    """Logger whose handler only enqueues; a listener thread does the actual printing."""
+    global _console_listener
+    if _console_listener is None:
+        records = queue.SimpleQueue()
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _console_listener = logging.handlers.QueueListener(records, handler)
+        _console_listener.start()
+        _console_logger.addHandler(logging.handlers.QueueHandler(records))
+        _console_logger.setLevel(logging.INFO)
+        _console_logger.propagate = False
+    return _console_logger
+
+class LogBuffer:
+    """Fixed-capacity ring of structured log entries with monotonic sequence numbers."""
+
+    def __init__(self, capacity: int = LOG_CAPACITY, console: bool = LOG_CONSOLE):
+        self._entries = collections.deque(maxlen=capacity)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self.console = console
+
+    def append(self, text: str, direction: str = "info", level: str = "info") -> Dict[str, Any]:
+        with self._lock:
+            self._seq += 1
+            entry = {
+                "seq": self._seq,
+                "timestamp": time.time(),
+                "direction": direction,
+                "level": level,
+                "text": text
+            }
+            self._entries.append(entry)
+
+        if self.console:
+            prefix = f"{direction}: " if direction != "info" else ""
+            _console().log(logging.ERROR if level == "error" else logging.INFO, f"{prefix}{text}")
+        return entry
+
+    def since(self, seq: Optional[int] = None, direction: Optional[str] = None,
+              level: Optional[str] = None, limit: int = 50) -> Tuple[List[Dict[str, Any]], int, bool]:
+        """Entries newer than `seq`, or the latest `limit`, with the next cursor and whether matches were left out."""
+        with self._lock:
+            entries = self._entries
+            head = self._seq
+            first = entries[0]["seq"] if entries else head + 1
+            if seq is None:
+                start = 0
+                dropped = False
+            else:
+                # Sequence numbers are contiguous, so the start offset is arithmetic
+                start = max(0, seq - first + 1)
+                dropped = seq < first - 1
+            selected = [entry for entry in itertools.islice(entries, start, None)
+                        if (direction is None or entry["direction"] == direction)
+                        and (level is None or entry["level"] == level)]
+
+        # Matches are left out beyond `limit`, or when already dropped from the buffer
+        if seq is None:
+            return selected[-limit:], head, len(selected) > limit
+        if len(selected) > limit:
+            # Continue right after the last entry returned
+            return selected[:limit], selected[limit - 1]["seq"] if limit > 0 else seq, True
+        return selected, head, dropped
+
+    def __len__(self):
+        return len(self._entries)
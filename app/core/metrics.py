@@ -0,0 +1,271 @@
+import bisect
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Default latency buckets in seconds, from a fast serial round trip to a slow upload
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.label_names:
+            # Unlabelled metrics report zero before their first update
+            self._default()
+
+    def labels(self, *values, **kwargs):
+        """Child metric for one combination of label values."""
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.label_names)
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _default(self):
+        return self.labels()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(child.render(self.name, self.label_names, key))
+        return lines
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def render(self, name, label_names, key):
+        return [f"{name}{_format_labels(label_names, key)} {_format_value(self.value)}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+class _GaugeChild:
+    def __init__(self, function: Optional[Callable[[], float]] = None):
+        self.value = 0.0
+        self.function = function
+
+    def set(self, value: float):
+        self.value = value
+
+    def render(self, name, label_names, key):
+        value = self.function() if self.function else self.value
+        return [f"{name}{_format_labels(label_names, key)} {_format_value(value)}"]
+
+class Gauge(_Metric):
+    """A value that goes up and down; set directly or read from a function at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (),
+                 function: Optional[Callable[[], float]] = None):
+        self._function = function
+        super().__init__(name, help, labels)
+
+    def _new_child(self):
+        return _GaugeChild(self._function)
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def set_function(self, function: Callable[[], float], *values):
+        """Read this gauge (or its child for `values`) from `function` on each scrape."""
+        self.labels(*values).function = function
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+class _HistogramChild:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        # A bisect and two additions under a lock; formatting waits for a scrape
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self) -> _Timer:
+        """Context manager that observes the time spent inside it."""
+        return _Timer(self)
+
+    def render(self, name, label_names, key):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{name}_bucket{_format_labels(label_names, key, le)} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(label_names, key)} {_format_value(total)}")
+        lines.append(f"{name}_count{_format_labels(label_names, key)} {cumulative}")
+        return lines
+
+class Histogram(_Metric):
+    """Bucketed distribution of observations, e.g. latencies in seconds; formatted only when scraped."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labels)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def time(self) -> _Timer:
+        return self._default().time()
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Tuple[str, ...] = (),
+              function: Optional[Callable[[], float]] = None) -> Gauge:
+        return self.register(Gauge(name, help, labels, function))
+
+    def histogram(self, name: str, help: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# Create a singleton instance
+registry = Registry()
+
+# --- CNC ---
+CNC_COMMAND_SECONDS = registry.histogram(
+    "cnc_command_seconds", "Time from writing a G-code line to its ok/error acknowledgement",
+    labels=("controller",))
+CNC_COMMAND_TIMEOUTS = registry.counter(
+    "cnc_command_timeouts_total", "Commands that got no acknowledgement within their timeout",
+    labels=("controller",))
+CNC_COMMAND_ERRORS = registry.counter(
+    "cnc_command_errors_total", "Commands the controller answered with an error",
+    labels=("controller",))
+CNC_STAGE_SECONDS = registry.histogram(
+    "cnc_stage_seconds", "Time from starting a sequence stage until the controller reports its motion complete",
+    labels=("controller", "stage"))
+CNC_PENDING_COMMANDS = registry.gauge(
+    "cnc_pending_commands", "Commands written to the controller and not yet acknowledged",
+    labels=("controller",))
+CNC_SCHEDULER_WAIT_SECONDS = registry.histogram(
+    "cnc_scheduler_wait_seconds", "Time a command waited for its lane's turn on the controller",
+    labels=("controller", "lane"))
+CNC_CONNECTED = registry.gauge(
+    "cnc_connected", "Whether the controller's serial port is open (1) or not (0)",
+    labels=("controller",))
+CNC_DISCONNECTS = registry.counter(
+    "cnc_disconnects_total", "Times the controller's serial port failed and was dropped",
+    labels=("controller",))
+CNC_RECONNECT_SECONDS = registry.histogram(
+    "cnc_reconnect_seconds", "Time from losing the controller until its port is open again",
+    labels=("controller",), buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0))
+CNC_JOG_REQUESTS = registry.counter(
+    "cnc_jog_requests_total", "Jog requests received from clients",
+    labels=("controller",))
+CNC_JOG_COMMANDS = registry.counter(
+    "cnc_jog_commands_total", "Jog commands written to the controller after merging requests",
+    labels=("controller",))
+CNC_JOG_CLAMPED = registry.counter(
+    "cnc_jog_clamped_total", "Jogs shortened because too much jog motion was already queued",
+    labels=("controller",))
+
+# --- Moisture ---
+MOISTURE_SENSOR_VISITS = registry.counter(
+    "moisture_sensor_visits_total", "Slots sequences lowered the moisture sensor into",
+    labels=("controller",))
+MOISTURE_SENSOR_SKIPPED = registry.counter(
+    "moisture_sensor_skipped_total", "Slots not sensed because the drying model predicted them above threshold",
+    labels=("controller",))
+
+# --- Database ---
+DB_OPERATION_SECONDS = registry.histogram(
+    "db_operation_seconds", "MongoDB operation latency", labels=("operation", "collection"))
+DB_DOCUMENTS_WRITTEN = registry.counter(
+    "db_documents_written_total", "Documents inserted by the batch writer", labels=("collection",))
+DB_DOCUMENTS_DROPPED = registry.counter(
+    "db_documents_dropped_total", "Documents the batch writer gave up on")
+DB_WRITE_QUEUE_DEPTH = registry.gauge(
+    "db_write_queue_depth", "Documents waiting in the batch writer queue")
+
+# --- Images ---
+IMAGE_RENDER_SECONDS = registry.histogram(
+    "image_render_seconds", "Time to render an inspection image in the worker pool")
+IMAGE_UPLOAD_SECONDS = registry.histogram(
+    "image_upload_seconds", "Image upload latency", labels=("result",))
+IMAGE_SPOOL_PENDING = registry.gauge(
+    "image_spool_pending", "Spooled images waiting for upload")
+
+# --- Jobs and clients ---
+JOB_QUEUE_DEPTH = registry.gauge(
+    "job_queue_depth", "Jobs queued behind the running one")
+EVENT_SUBSCRIBERS = registry.gauge(
+    "event_subscribers", "Connected live-state stream clients", labels=("controller",))
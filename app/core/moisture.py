@@ -0,0 +1,157 @@
+import json
+import os
+import threading
+import time
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from .grid import grid, Grid
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Recent readings kept in memory for each slot
+MOISTURE_HISTORY_SIZE = int(os.getenv("MOISTURE_HISTORY_SIZE", "48"))
+# Shortest span of readings, in seconds, that a trend is reported for
+MIN_TREND_SPAN = 60
+
+class MoistureStore:
+    """Current soil moisture for every slot, plus a ring of recent readings per slot."""
+
+    def __init__(self, grid: Grid, history_size: int = MOISTURE_HISTORY_SIZE):
+        self.grid = grid
+        self.history_size = history_size
+        size = len(grid)
+        # Row-major slot order, so threshold selection and trends are vectorized
+        self.values = np.full(size, np.nan)
+        self._history = np.full((size, history_size), np.nan)
+        self._times = np.full((size, history_size), np.nan)
+        # Next ring position to write for each slot
+        self._head = np.zeros(size, dtype=int)
+        self._lock = threading.Lock()
+        self._version = 0
+        # The API snapshot is serialized once per change
+        self._snapshot = None
+        self.updated_at = None
+
+    def get(self, row: int, col: int, default: Optional[float] = None) -> Optional[float]:
+        if (row, col) not in self.grid:
+            return default
+        value = self.values[self.grid.index(row, col)]
+        return default if np.isnan(value) else float(value)
+
+    def record(self, row: int, col: int, moisture: float, timestamp: Optional[float] = None):
+        """Set a slot's moisture and append the reading to its history."""
+        index = self.grid.index(row, col)
+        self._write(np.array([index]), np.array([moisture], dtype=float), timestamp)
+
+    def record_all(self, values, timestamp: Optional[float] = None):
+        """Set every slot at once from an array in row-major slot order."""
+        values = np.asarray(values, dtype=float).reshape(-1)
+        self._write(np.arange(len(self.grid)), values, timestamp)
+
+    def _write(self, indices: np.ndarray, values: np.ndarray, timestamp: Optional[float]):
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            self.values[indices] = values
+            heads = self._head[indices]
+            self._history[indices, heads] = values
+            self._times[indices, heads] = timestamp
+            self._head[indices] = (heads + 1) % self.history_size
+            self._version += 1
+            self.updated_at = timestamp
+
+    def below(self, threshold: float, slots: Optional[List[Tuple[int, int]]] = None) -> List[Tuple[int, int]]:
+        """Slots whose current moisture is below `threshold` (among `slots`, or the whole grid)."""
+        if slots is None:
+            indices = np.flatnonzero(self.values < threshold)
+        else:
+            indices = self.grid.indices(slots)
+            indices = indices[self.values[indices] < threshold]
+        return [self.grid.slot(index) for index in indices]
+
+    def history(self, row: int, col: int) -> List[Dict[str, float]]:
+        """Recent readings for a slot, oldest first."""
+        index = self.grid.index(row, col)
+        with self._lock:
+            # Rotate the ring so the oldest entry comes first
+            order = np.roll(np.arange(self.history_size), -self._head[index])
+            times = self._times[index, order]
+            values = self._history[index, order]
+        present = ~np.isnan(times)
+        return [{"timestamp": float(t), "moisture": float(v)} for t, v in zip(times[present], values[present])]
+
+    def readings(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Every reading held in memory as flat (slot index, timestamp, moisture) arrays."""
+        with self._lock:
+            present = ~np.isnan(self._times)
+            indices = np.nonzero(present)[0]
+            return indices, self._times[present], self._history[present]
+
+    def latest(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Current moisture of every slot and when it was recorded; NaN where unknown."""
+        with self._lock:
+            values = self.values.copy()
+            times = np.where(np.isnan(self._times), -np.inf, self._times).max(axis=1)
+        times[np.isinf(times)] = np.nan
+        return values, times
+
+    def trends(self) -> np.ndarray:
+        """Least-squares slope of recent readings per slot, per hour; NaN where they span under MIN_TREND_SPAN s."""
+        with self._lock:
+            times = self._times.copy()
+            values = self._history.copy()
+        present = ~np.isnan(times)
+        count = present.sum(axis=1)
+        hours = np.where(present, times / 3600.0, 0.0)
+        values = np.where(present, values, 0.0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_t = hours.sum(axis=1) / count
+            mean_v = values.sum(axis=1) / count
+            dt = np.where(present, hours - mean_t[:, None], 0.0)
+            dv = np.where(present, values - mean_v[:, None], 0.0)
+            slope = (dt * dv).sum(axis=1) / (dt * dt).sum(axis=1)
+            span = np.where(present, times, -np.inf).max(axis=1) - np.where(present, times, np.inf).min(axis=1)
+        slope[~np.isfinite(slope) | ~(span >= MIN_TREND_SPAN)] = np.nan
+        return slope
+
+    def trend(self, row: int, col: int) -> Optional[float]:
+        slope = self.trends()[self.grid.index(row, col)]
+        return None if np.isnan(slope) else float(slope)
+
+    def snapshot(self) -> bytes:
+        """Current moisture of every slot as JSON: a rows x cols matrix, null where unknown."""
+        with self._lock:
+            if self._snapshot is not None and self._snapshot[0] == self._version:
+                return self._snapshot[1]
+            version = self._version
+            matrix = np.round(self.values, 1).reshape(self.grid.rows, self.grid.cols)
+            updated_at = self.updated_at
+
+        moisture = [[None if np.isnan(value) else value for value in row] for row in matrix.tolist()]
+        body = json.dumps({
+            "rows": self.grid.rows,
+            "cols": self.grid.cols,
+            "moisture": moisture,
+            "updated_at": updated_at
+        }, separators=(",", ":")).encode("utf-8")
+
+        with self._lock:
+            if self._version == version:
+                self._snapshot = (version, body)
+        return body
+
+    def __len__(self):
+        return len(self.grid)
+
+# Create a singleton instance
+soil_moisture = MoistureStore(grid)
+
+def update_soil_moisture_data(store: Optional[MoistureStore] = None):
+    """Update all soil moisture values with random data (for simulation)"""
+    store = store or soil_moisture
+    store.record_all(np.random.randint(20, 81, size=len(store)))
+    return store
+
+# Initialize soil moisture with random values
+update_soil_moisture_data()
@@ -0,0 +1,103 @@
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from .grid import Grid, grid as default_grid
+
+Slot = Tuple[int, int]
+
+def _point(position: Optional[Dict[str, float]]) -> np.ndarray:
+    """XY of a machine position dict, treating missing axes as 0."""
+    if not position:
+        return np.zeros(2)
+    return np.array([position.get("X", 0.0), position.get("Y", 0.0)], dtype=float)
+
+def _points(route: List[Slot], grid: Grid) -> np.ndarray:
+    """XY of each slot in `route` as an (n, 2) array; axes a slot does not command count as 0."""
+    return np.nan_to_num(grid.xy[grid.indices(route)]) if route else np.zeros((0, 2))
+
+def _path(route: List[Slot], start, end, grid: Grid) -> np.ndarray:
+    # G0 moves are interpolated in a straight line, so travel is Euclidean
+    parts = [_point(start)[None, :], _points(route, grid)]
+    if end is not None:
+        parts.append(_point(end)[None, :])
+    return np.concatenate(parts)
+
+def _length(points: np.ndarray) -> float:
+    steps = np.diff(points, axis=0)
+    return float(np.hypot(steps[:, 0], steps[:, 1]).sum())
+
+def route_length(route: List[Slot], start: Optional[Dict[str, float]] = None,
+                 end: Optional[Dict[str, float]] = None, grid: Optional[Grid] = None) -> float:
+    """Total XY travel of visiting `route` from `start`, optionally finishing at `end`."""
+    return _length(_path(route, start, end, grid or default_grid))
+
+def _serpentine(slots: List[Slot], start, end, grid: Grid) -> List[Slot]:
+    """Boustrophedon sweep, trying each corner and sweep axis and keeping the shortest."""
+    candidates = []
+    for by_row in (True, False):
+        major, minor = (0, 1) if by_row else (1, 0)
+        lines = {}
+        for slot in slots:
+            lines.setdefault(slot[major], []).append(slot)
+        for reverse_major in (False, True):
+            for reverse_first in (False, True):
+                route = []
+                for i, key in enumerate(sorted(lines, reverse=reverse_major)):
+                    reverse = reverse_first if i % 2 == 0 else not reverse_first
+                    route.extend(sorted(lines[key], key=lambda slot: slot[minor], reverse=reverse))
+                candidates.append(route)
+    return min(candidates, key=lambda route: route_length(route, start, end, grid))
+
+def _nearest_neighbour(slots: List[Slot], start, grid: Grid) -> List[Slot]:
+    points = _points(slots, grid)
+    visited = np.zeros(len(slots), dtype=bool)
+    current = _point(start)
+    order = []
+    for _ in range(len(slots)):
+        distances = np.hypot(points[:, 0] - current[0], points[:, 1] - current[1])
+        distances[visited] = np.inf
+        nearest = int(np.argmin(distances))
+        visited[nearest] = True
+        order.append(nearest)
+        current = points[nearest]
+    return [slots[i] for i in order]
+
+def _two_opt(route: List[Slot], start, end, grid: Grid) -> List[Slot]:
+    """Reverse segments of the open path while that shortens it; the start stays fixed."""
+    points = _path(route, start, end, grid)
+    order = np.arange(len(route))
+    # Indices into `points` that may move: the slots, not the fixed start/end
+    last = len(route)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, last):
+            a, b = points[i - 1], points[i]
+            # Gains of every segment end for this start at once; the best reversal is applied
+            c = points[i + 1:last + 1]
+            j = np.arange(i + 1, last + 1)
+            # The point after each candidate segment, if the path continues past it
+            follows = j + 1 < len(points)
+            d = points[np.minimum(j + 1, len(points) - 1)]
+            before = np.hypot(*(a - b)) + np.where(follows, np.hypot(*(c - d).T), 0.0)
+            after = np.hypot(*(a - c).T) + np.where(follows, np.hypot(*(b - d).T), 0.0)
+            gain = before - after
+            best = int(np.argmax(gain))
+            if gain[best] > 1e-9:
+                k = j[best]
+                points[i:k + 1] = points[i:k + 1][::-1]
+                order[i - 1:k] = order[i - 1:k][::-1]
+                improved = True
+    return [route[i] for i in order]
+
+def plan_route(slots: List[Slot], start: Optional[Dict[str, float]] = None,
+               end: Optional[Dict[str, float]] = None, grid: Optional[Grid] = None) -> List[Slot]:
+    """Order `slots` of `grid` for minimum travel from `start`, counting the trip to `end` (usually home)."""
+    grid = grid or default_grid
+    slots = [tuple(slot) for slot in dict.fromkeys(slots) if slot in grid]
+    if len(slots) <= 1:
+        return slots
+
+    # Full sweeps use a serpentine; sparse subsets a nearest-neighbour tour refined with 2-opt
+    if len(slots) == len(grid):
+        return _serpentine(slots, start, end, grid)
+    return _two_opt(_nearest_neighbour(slots, start, grid), start, end, grid)
@@ -0,0 +1,131 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any
+from dotenv import load_dotenv
+from .metrics import CNC_SCHEDULER_WAIT_SECONDS
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Seconds sequences stay paused after the last interactive command, so an
+# operator's series of jogs is not interleaved with slot visits
+INTERACTIVE_HOLD = float(os.getenv("CNC_INTERACTIVE_HOLD", "5.0"))
+
+REALTIME = "realtime"
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+class CommandScheduler:
+    """Decides whose turn it is to send lines to one controller: realtime, then interactive, then batch."""
+
+    def __init__(self, cnc, interactive_hold: float = INTERACTIVE_HOLD):
+        self.cnc = cnc
+        self.interactive_hold = interactive_hold
+        self.paused = False
+        # Operators wait only for the batch unit on the machine, which ends with
+        # motion complete and the tool raised, so the gap between units is safe
+        self._interactive = 0
+        self._batch_active = False
+        self._last_interactive = None
+        self._changed = None
+        self._wait_seconds = {lane: CNC_SCHEDULER_WAIT_SECONDS.labels(cnc.id, lane)
+                              for lane in (REALTIME, INTERACTIVE, BATCH)}
+
+    def _condition(self) -> asyncio.Condition:
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        return self._changed
+
+    def _hold_remaining(self) -> float:
+        if self._last_interactive is None:
+            return 0.0
+        return max(0.0, self._last_interactive + self.interactive_hold - time.monotonic())
+
+    def realtime(self, command: str):
+        """Send a GRBL real-time command straight away."""
+        start = time.perf_counter()
+        self.cnc.send_realtime(command)
+        self._wait_seconds[REALTIME].observe(time.perf_counter() - start)
+
+    @asynccontextmanager
+    async def interactive(self):
+        """Hold the machine for an operator command, once the current batch unit is done."""
+        start = time.perf_counter()
+        changed = self._condition()
+        async with changed:
+            self._interactive += 1
+            try:
+                await changed.wait_for(lambda: not self._batch_active)
+            except BaseException:
+                self._interactive -= 1
+                changed.notify_all()
+                raise
+        self._wait_seconds[INTERACTIVE].observe(time.perf_counter() - start)
+        try:
+            yield
+        finally:
+            async with changed:
+                self._interactive -= 1
+                self._last_interactive = time.monotonic()
+                changed.notify_all()
+
+    async def _notify(self):
+        async with self._condition():
+            self._condition().notify_all()
+
+    @asynccontextmanager
+    async def batch(self, job=None):
+        """Hold the machine for one batch unit; raises JobCancelled if `job` is cancelled while waiting."""
+        start = time.perf_counter()
+        changed = self._condition()
+        loop = asyncio.get_running_loop()
+
+        def wake():
+            # Cancellation may come from a threadpool endpoint
+            loop.call_soon_threadsafe(lambda: loop.create_task(self._notify()))
+
+        if job:
+            job.add_cancel_callback(wake)
+        try:
+            async with changed:
+                # Waiting operators, their recent activity and a pause all come first
+                while self._interactive or self.paused or self._hold_remaining() > 0:
+                    if job:
+                        job.check_cancelled()
+                    # The hold expires without anyone notifying, so wake up for it
+                    timeout = self._hold_remaining() or None
+                    try:
+                        await asyncio.wait_for(changed.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                self._batch_active = True
+        finally:
+            if job:
+                job.remove_cancel_callback(wake)
+        self._wait_seconds[BATCH].observe(time.perf_counter() - start)
+        try:
+            yield
+        finally:
+            async with changed:
+                self._batch_active = False
+                changed.notify_all()
+
+    async def pause(self):
+        """Stop sequences at their next safe point until resume()."""
+        async with self._condition():
+            self.paused = True
+
+    async def resume(self):
+        async with self._condition():
+            self.paused = False
+            self._condition().notify_all()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "paused": self.paused,
+            "batch_active": self._batch_active,
+            "interactive_waiting": self._interactive,
+            "hold_remaining": round(self._hold_remaining(), 3)
+        }
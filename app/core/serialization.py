@@ -0,0 +1,49 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+
+def _default(value: Any):
+    """Encode the BSON and datetime values MongoDB documents contain."""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(content: Any) -> str:
+    return json.dumps(content, default=_default, separators=(",", ":"))
+
+class MongoJSONResponse(JSONResponse):
+    """JSON response that encodes ObjectId and datetime in one json.dumps, skipping FastAPI's jsonable_encoder pass."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content).encode("utf-8")
+
+def encode_cursor(timestamp: datetime, object_id: ObjectId) -> str:
+    """Opaque keyset cursor for the position (timestamp, _id)."""
+    raw = json.dumps({"t": timestamp.isoformat(), "id": str(object_id)}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(data["t"]), ObjectId(data["id"])
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def parse_fields(fields: Optional[str]) -> Optional[Dict[str, int]]:
+    """Turn "a,b.c" into a MongoDB inclusion projection."""
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    for name in names:
+        if name.startswith("$"):
+            raise ValueError(f"Invalid field: {name}")
+    return {name: 1 for name in names}
@@ -0,0 +1,447 @@
+import collections
+import math
+import os
+import queue
+import re
+import serial
+import threading
+import time
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Simulated seconds per wall-clock second; raise it to run sequences faster than real time
+SIM_SPEEDUP = float(os.getenv("CNC_SIM_SPEEDUP", "1.0"))
+
+# Same buffer sizes as GRBL 1.1 on an ATmega328p
+RX_BUFFER_SIZE = 128
+PLANNER_SIZE = 15
+
+# Wall-clock seconds between motion updates
+TICK = 0.005
+
+BANNER = "Grbl 1.1h ['$' for help]"
+
+# $-settings the simulator uses: max rate (mm/min), acceleration (mm/s^2) and max travel (mm) per axis
+DEFAULT_SETTINGS = {
+    110: 5000.0, 111: 5000.0, 112: 1000.0,
+    120: 200.0, 121: 200.0, 122: 100.0,
+    130: 400.0, 131: 300.0, 132: 100.0,
+}
+
+AXES = ("X", "Y", "Z")
+WORD = re.compile(r"([A-Z])([-+]?(?:\d+\.?\d*|\.\d+))")
+# GRBL drops "(...)" and ";" comments before parsing a line
+COMMENT = re.compile(r"\([^)]*\)|;.*")
+
+# GRBL error codes
+EXPECTED_COMMAND_LETTER = 1
+BAD_NUMBER_FORMAT = 2
+INVALID_STATEMENT = 3
+UNSUPPORTED_COMMAND = 20
+UNDEFINED_FEED_RATE = 22
+
+class GCodeError(Exception):
+    def __init__(self, code: int):
+        super().__init__(f"error:{code}")
+        self.code = code
+
+class Block:
+    """One planned linear move with a trapezoidal velocity profile, starting and ending at rest."""
+
+    def __init__(self, start: List[float], target: List[float], rate: float,
+                 settings: Dict[int, float], jog: bool = False):
+        self.start = start
+        self.target = target
+        self.jog = jog
+        delta = [t - s for s, t in zip(start, target)]
+        self.distance = math.sqrt(sum(d * d for d in delta))
+        self.unit = [d / self.distance for d in delta] if self.distance else [0.0, 0.0, 0.0]
+
+        # Real GRBL blends velocity through junctions, so chains of short moves
+        # come out slightly slow; single moves between slots are exact.
+        # The move is limited by whichever axis reaches its rate or acceleration limit first
+        max_rate = min((settings[110 + i] / 60.0) / abs(u) for i, u in enumerate(self.unit) if u) if self.distance else 0.0
+        self.accel = min(settings[120 + i] / abs(u) for i, u in enumerate(self.unit) if u) if self.distance else 1.0
+        self.rate = min(rate / 60.0, max_rate) if rate else max_rate
+
+        ramp = self.rate ** 2 / self.accel
+        if self.distance >= ramp:
+            self.cruise = self.distance - ramp
+            self.peak = self.rate
+        else:
+            # Triangular profile: never reaches the commanded rate
+            self.cruise = 0.0
+            self.peak = math.sqrt(self.distance * self.accel)
+        self.ramp_time = self.peak / self.accel if self.distance else 0.0
+        self.duration = 2 * self.ramp_time + (self.cruise / self.peak if self.peak else 0.0)
+
+    def travelled(self, t: float) -> float:
+        """Distance covered `t` seconds into the block."""
+        if t >= self.duration:
+            return self.distance
+        ramp_distance = 0.5 * self.accel * self.ramp_time ** 2
+        if t < self.ramp_time:
+            return 0.5 * self.accel * t * t
+        if t < self.duration - self.ramp_time:
+            return ramp_distance + self.peak * (t - self.ramp_time)
+        remaining = self.duration - t
+        return self.distance - 0.5 * self.accel * remaining * remaining
+
+    def position(self, t: float) -> List[float]:
+        s = self.travelled(t)
+        return [p + u * s for p, u in zip(self.start, self.unit)]
+
+    def speed(self, t: float) -> float:
+        if t >= self.duration:
+            return 0.0
+        if t < self.ramp_time:
+            return self.accel * t
+        if t < self.duration - self.ramp_time:
+            return self.peak
+        return self.accel * (self.duration - t)
+
+class SimulatedGrbl:
+    """In-process GRBL 1.1 controller that looks like a pyserial port, with an RX buffer, planner and timed moves."""
+
+    def __init__(self, speedup: float = SIM_SPEEDUP, settings: Optional[Dict[int, float]] = None):
+        self.speedup = speedup
+        self.settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+        self.position = [0.0, 0.0, 0.0]
+        self.state = "Idle"
+        self.absolute = True
+        self.motion = 0
+        self.feed = 0.0
+        self.overflows = 0
+        self.timeout = 1
+
+        self._rx = bytearray()
+        self._out = queue.Queue()
+        self._planner = collections.deque()
+        self._lock = threading.Condition()
+        self._hold = False
+        self._block = None
+        self._block_time = 0.0
+        # Bumped by a soft reset so blocked work from before it is abandoned
+        self._generation = 0
+        self._closed = False
+
+        self._emit(BANNER)
+        threading.Thread(target=self._protocol_loop, daemon=True).start()
+        threading.Thread(target=self._motion_loop, daemon=True).start()
+
+    # --- pyserial interface ---
+
+    def write(self, data: bytes) -> int:
+        with self._lock:
+            if self._closed:
+                raise serial.PortNotOpenError()
+            for byte in data:
+                if byte == ord("?"):
+                    self._emit(self._status_report())
+                elif byte == ord("!"):
+                    if self._block is not None or self._planner:
+                        self._hold = True
+                elif byte == ord("~"):
+                    self._hold = False
+                elif byte == 0x18:
+                    self._reset()
+                elif byte == 0x85:
+                    self._cancel_jog()
+                elif len(self._rx) < RX_BUFFER_SIZE:
+                    self._rx.append(byte)
+                else:
+                    # The real controller silently drops bytes that do not fit
+                    self.overflows += 1
+            self._lock.notify_all()
+        return len(data)
+
+    def readline(self) -> bytes:
+        if self._closed:
+            raise serial.PortNotOpenError()
+        try:
+            return self._out.get(timeout=self.timeout)
+        except queue.Empty:
+            return b""
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._lock.notify_all()
+
+    # --- controller internals ---
+
+    def _emit(self, line: str):
+        self._out.put((line + "\r\n").encode())
+
+    def _status_report(self) -> str:
+        if self._hold:
+            state = "Hold:0"
+        elif self._block is not None or self._planner:
+            state = "Jog" if (self._block or self._planner[0]).jog else "Run"
+        else:
+            state = self.state
+        speed = self._block.speed(self._block_time) * 60 if self._block is not None and not self._hold else 0
+        mpos = ",".join(f"{value:.3f}" for value in self.position)
+        buffers = f"{PLANNER_SIZE - len(self._planner)},{RX_BUFFER_SIZE - len(self._rx)}"
+        return f"<{state}|MPos:{mpos}|Bf:{buffers}|FS:{speed:.0f},0>"
+
+    def _reset(self):
+        self._generation += 1
+        self._rx.clear()
+        self._planner.clear()
+        self._block = None
+        self._hold = False
+        self.state = "Idle"
+        self._emit(BANNER)
+
+    def _cancel_jog(self):
+        if self._block is not None and self._block.jog:
+            # Stop where the jog currently is and drop the queued jog motions
+            self._block = None
+            self._hold = False
+            self._planner = collections.deque(block for block in self._planner if not block.jog)
+
+    def _wait(self, predicate, generation: int) -> bool:
+        """Wait under the lock until `predicate()`; False if a reset or close intervened."""
+        while not predicate():
+            if self._generation != generation or self._closed:
+                return False
+            self._lock.wait(TICK)
+        return self._generation == generation and not self._closed
+
+    def _protocol_loop(self):
+        with self._lock:
+            while not self._closed:
+                if b"\n" not in self._rx:
+                    self._lock.wait()
+                    continue
+                end = self._rx.index(b"\n")
+                line = COMMENT.sub("", self._rx[:end].decode(errors="replace")).strip()
+                del self._rx[:end + 1]
+                if not line:
+                    # GRBL acknowledges blank and comment-only lines too, keeping acks in step
+                    self._emit("ok")
+                    continue
+
+                generation = self._generation
+                try:
+                    response = self._execute(line, generation)
+                except GCodeError as e:
+                    response = f"error:{e.code}"
+                if response is not None and generation == self._generation:
+                    self._emit(response)
+
+    def _execute(self, line: str, generation: int) -> Optional[str]:
+        """Run one line with the lock held; returns the acknowledgement, or None if reset meanwhile."""
+        if line.startswith("$"):
+            return self._system_command(line, generation)
+
+        words = self._parse(line)
+        target = self._planned_position()
+        motion = self.motion
+        absolute = self.absolute
+        dwell = None
+        axes = {}
+
+        for letter, value in words:
+            if letter == "G":
+                if value in (0, 1):
+                    motion = int(value)
+                elif value == 4:
+                    dwell = 0.0
+                elif value == 90:
+                    absolute = True
+                elif value == 91:
+                    absolute = False
+                elif value in (17, 20, 21, 94):
+                    pass
+                else:
+                    raise GCodeError(UNSUPPORTED_COMMAND)
+            elif letter == "M":
+                # Spindle, coolant and program flow have no motion to simulate
+                if value not in (0, 1, 2, 3, 4, 5, 7, 8, 9, 30):
+                    raise GCodeError(UNSUPPORTED_COMMAND)
+            elif letter == "F":
+                self.feed = value
+            elif letter == "P":
+                if dwell is None:
+                    raise GCodeError(UNSUPPORTED_COMMAND)
+                dwell = value
+            elif letter in AXES:
+                axes[letter] = value
+            elif letter not in ("S", "T", "N"):
+                raise GCodeError(UNSUPPORTED_COMMAND)
+
+        self.motion, self.absolute = motion, absolute
+
+        if dwell is not None:
+            # G4 synchronizes with the planner before dwelling, so G4 P0 is
+            # acknowledged only once the machine has stopped
+            if not self._wait(lambda: self._block is None and not self._planner, generation):
+                return None
+            deadline = time.monotonic() + dwell / self.speedup
+            if not self._wait(lambda: time.monotonic() >= deadline, generation):
+                return None
+            return "ok"
+
+        if axes:
+            if motion == 1 and not self.feed:
+                raise GCodeError(UNDEFINED_FEED_RATE)
+            for axis, value in axes.items():
+                i = AXES.index(axis)
+                target[i] = value if absolute else target[i] + value
+            rate = self.feed if motion == 1 else 0.0
+            if not self._queue_block(target, rate, generation):
+                return None
+        return "ok"
+
+    def _planned_position(self) -> List[float]:
+        """Where the machine will be once everything planned so far has run."""
+        # The executing block stays at the head of the planner until it finishes
+        return list(self._planner[-1].target if self._planner else self.position)
+
+    def _queue_block(self, target: List[float], rate: float, generation: int, jog: bool = False) -> bool:
+        # Block until the planner has room, which is what holds back the ack
+        if not self._wait(lambda: len(self._planner) < PLANNER_SIZE, generation):
+            return False
+        self._planner.append(Block(self._planned_position(), target, rate, self.settings, jog=jog))
+        self._lock.notify_all()
+        return True
+
+    def _system_command(self, line: str, generation: int) -> Optional[str]:
+        command = line[1:].upper().replace(" ", "")
+        if command == "$":
+            for key in sorted(self.settings):
+                self._emit(f"${key}={self.settings[key]:.3f}")
+            return "ok"
+        if command in ("X", "C", "G", "#", "I", "N"):
+            return "ok"
+        if command == "H":
+            # Homing: move to the machine origin
+            if not self._queue_block([0.0, 0.0, 0.0], 0.0, generation):
+                return None
+            if not self._wait(lambda: self._block is None and not self._planner, generation):
+                return None
+            return "ok"
+        if command.startswith("J="):
+            return self._jog(command[2:], generation)
+        if "=" in command:
+            key, _, value = command.partition("=")
+            try:
+                self.settings[int(key)] = float(value)
+            except ValueError:
+                raise GCodeError(INVALID_STATEMENT)
+            return "ok"
+        raise GCodeError(INVALID_STATEMENT)
+
+    def _jog(self, line: str, generation: int) -> Optional[str]:
+        """$J= jog: a G1 move with its own F that does not change the modal state."""
+        words = self._parse(line)
+        absolute = self.absolute
+        feed = None
+        axes = {}
+        for letter, value in words:
+            if letter == "G" and value in (90, 91):
+                absolute = value == 90
+            elif letter == "G" and value in (20, 21, 53):
+                pass
+            elif letter == "F":
+                feed = value
+            elif letter in AXES:
+                axes[letter] = value
+            else:
+                raise GCodeError(INVALID_STATEMENT)
+        if not feed or not axes:
+            raise GCodeError(INVALID_STATEMENT)
+
+        target = self._planned_position()
+        for axis, value in axes.items():
+            i = AXES.index(axis)
+            target[i] = value if absolute else target[i] + value
+        if not self._queue_block(target, feed, generation, jog=True):
+            return None
+        return "ok"
+
+    def _parse(self, line: str):
+        text = line.upper().replace(" ", "")
+        words = []
+        index = 0
+        while index < len(text):
+            match = WORD.match(text, index)
+            if not match:
+                if text[index].isalpha():
+                    raise GCodeError(BAD_NUMBER_FORMAT)
+                raise GCodeError(EXPECTED_COMMAND_LETTER)
+            words.append((match.group(1), float(match.group(2))))
+            index = match.end()
+        return words
+
+    def _motion_loop(self):
+        with self._lock:
+            while not self._closed:
+                if self._block is None:
+                    if not self._planner:
+                        self._lock.wait()
+                        continue
+                    self._block = self._planner[0]
+                    self._block_time = 0.0
+                    last = time.monotonic()
+
+                self._lock.wait(TICK)
+                now = time.monotonic()
+                elapsed, last = now - last, now
+                block = self._block
+                if block is None:
+                    # Reset or jog cancel: stay where the interpolation left off
+                    continue
+                if self._hold:
+                    continue
+
+                self._block_time += elapsed * self.speedup
+                self.position = block.position(self._block_time)
+                if self._block_time >= block.duration:
+                    self.position = list(block.target)
+                    self._block = None
+                    if self._planner and self._planner[0] is block:
+                        self._planner.popleft()
+                    if not self._planner:
+                        self._hold = False
+                    self._lock.notify_all()
+
+def open_pty(controller: Optional[SimulatedGrbl] = None) -> str:
+    """Serve a simulated controller on a pseudo-terminal and return its device path, e.g. for CNC_PORT."""
+    import pty
+    import tty
+
+    controller = controller or SimulatedGrbl()
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    path = os.ttyname(slave)
+
+    def to_controller():
+        while True:
+            try:
+                data = os.read(master, 1024)
+            except OSError:
+                return
+            controller.write(data)
+
+    def from_controller():
+        while True:
+            line = controller.readline()
+            if line:
+                os.write(master, line)
+
+    threading.Thread(target=to_controller, daemon=True).start()
+    threading.Thread(target=from_controller, daemon=True).start()
+    # Keep the slave end open so the device stays available between clients
+    controller._pty = (master, slave)
+    return path
+
+if __name__ == "__main__":
+    print(f"Simulated GRBL controller on {open_pty()}", flush=True)
+    while True:
+        time.sleep(3600)
@@ -0,0 +1,206 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime, UTC
+from io import BytesIO
+from typing import Dict, Any, List, Optional
+from dotenv import load_dotenv
+from .storage import render_plant_image, run_in_image_worker, upload_image
+from . import database
+from .checkpoints import checkpoints
+from .metrics import IMAGE_SPOOL_PENDING
+
+# Load environment variables from .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Directory holding images that have not been uploaded yet
+SPOOL_DIR = os.getenv("IMAGE_SPOOL_DIR", "spool")
+# Longest wait between upload retries, in seconds
+SPOOL_MAX_BACKOFF = 300
+# How long an uploaded image's URL is kept for documents saved after the upload,
+# unless a checkpoint that is not saved yet still refers to it
+SPOOL_RESOLVED_TTL = 24 * 3600
+
+LOCAL_PREFIX = "spool:"
+
+class ImageSpool:
+    """On-disk spool of captured images, referenced as "spool:<sha256>" until a background uploader sends them."""
+
+    def __init__(self, directory: str = SPOOL_DIR):
+        self.directory = directory
+        # Uploaded images by local reference, kept until stored cycles carry their URL
+        self.resolved: Dict[str, Dict[str, Any]] = {}
+        self._queue = None
+        self._task = None
+
+    def _paths(self, digest: str):
+        # A JSON sidecar next to each image lets pending uploads survive restarts
+        base = os.path.join(self.directory, digest)
+        return base + ".jpg", base + ".json"
+
+    def _write_entry(self, digest: str, data: Optional[bytes], meta: Dict[str, Any]):
+        os.makedirs(self.directory, exist_ok=True)
+        image_path, meta_path = self._paths(digest)
+        if data is not None and not os.path.exists(image_path):
+            tmp = image_path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, image_path)
+        tmp = meta_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(meta, f, default=str)
+        os.replace(tmp, meta_path)
+
+    def _remove_entry(self, digest: str):
+        for path in self._paths(digest):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    async def store(self, data: bytes, filename: str) -> Dict[str, Any]:
+        """Spool an image and return its local reference without touching the network."""
+        digest = hashlib.sha256(data).hexdigest()
+        local_id = LOCAL_PREFIX + digest
+        meta = {"digest": digest, "filename": filename, "status": "pending",
+                "created_at": datetime.now(UTC), "attempts": 0}
+        await asyncio.to_thread(self._write_entry, digest, data, meta)
+        if self._queue is not None:
+            self._queue.put_nowait(meta)
+        return {
+            "success": True,
+            "filename": filename,
+            "local_id": local_id,
+            "url": local_id,
+            "spooled": True
+        }
+
+    def resolve(self, reference: str) -> str:
+        """Remote URL for a local reference once uploaded, otherwise the reference itself."""
+        entry = self.resolved.get(reference)
+        if not entry:
+            return reference
+        # The caller stores the URL itself, so no document will need updating
+        entry["consumed"] = True
+        return entry["url"]
+
+    def pending(self) -> List[Dict[str, Any]]:
+        """Sidecars of images on disk that are not yet uploaded."""
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    entries.append(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.error(f"Unreadable spool entry {name}: {e}")
+        return entries
+
+    async def start(self):
+        if self._task is not None and not self._task.done():
+            return
+        self._queue = asyncio.Queue()
+        for meta in await asyncio.to_thread(self.pending):
+            if meta.get("status") == "uploaded":
+                self.resolved[LOCAL_PREFIX + meta["digest"]] = meta
+            else:
+                self._queue.put_nowait(meta)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop uploading; anything not yet uploaded stays on disk for the next start."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            meta = await self._queue.get()
+            if await self._upload(meta):
+                # Only this image can have changed; a full pass per upload would be quadratic
+                await self.reconcile([LOCAL_PREFIX + meta["digest"]])
+
+    async def _upload(self, meta: Dict[str, Any]) -> bool:
+        """Upload one spooled image, retrying until it succeeds; False if the image is gone."""
+        digest = meta["digest"]
+        image_path, _ = self._paths(digest)
+        while True:
+            try:
+                with open(image_path, "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                logger.error(f"Spooled image {digest} is missing; skipping")
+                self._remove_entry(digest)
+                return False
+
+            result = await upload_image(BytesIO(data), meta["filename"])
+            if result.get("success"):
+                break
+
+            meta["attempts"] += 1
+            delay = min(SPOOL_MAX_BACKOFF, 2 ** meta["attempts"])
+            logger.warning(f"Upload of {meta['filename']} failed ({result.get('error')}); retrying in {delay}s")
+            await asyncio.to_thread(self._write_entry, digest, None, meta)
+            await asyncio.sleep(delay)
+
+        meta.update({"status": "uploaded", "url": result["url"], "uploaded_at": time.time()})
+        # The image itself is no longer needed, only its URL until documents are updated
+        await asyncio.to_thread(self._write_entry, digest, None, meta)
+        try:
+            os.remove(image_path)
+        except FileNotFoundError:
+            pass
+        self.resolved[LOCAL_PREFIX + digest] = meta
+        return True
+
+    async def reconcile(self, references: Optional[List[str]] = None):
+        """Swap uploaded images' local references (`references`, or all) for their URLs in stored cycles."""
+        now = time.time()
+        if references is None:
+            references = list(self.resolved)
+        held = None
+        for reference in references:
+            meta = self.resolved.get(reference)
+            if meta is None:
+                continue
+            updated = meta.get("consumed") or await database.replace_image_reference(reference, meta["url"])
+            if not updated:
+                if now - meta["uploaded_at"] <= SPOOL_RESOLVED_TTL:
+                    continue
+                if held is None:
+                    held = await checkpoints.image_references()
+                if reference in held:
+                    continue
+            if self.resolved.pop(reference, None) is None:
+                continue
+            await asyncio.to_thread(self._remove_entry, meta["digest"])
+
+# Create a singleton instance
+image_spool = ImageSpool()
+
+IMAGE_SPOOL_PENDING.set_function(lambda: image_spool._queue.qsize() if image_spool._queue else 0)
+
+async def capture_plant_image(row: int, col: int, has_issue: bool = False,
+                              issue_type: Optional[str] = None) -> Dict[str, Any]:
+    """Render an inspection image and spool it for upload; returns a local reference at once."""
+    try:
+        image_bytes, filename = await run_in_image_worker(render_plant_image, row, col, has_issue, issue_type)
+        return await image_spool.store(image_bytes, filename)
+    except Exception as e:
+        logger.error(f"Error spooling plant image: {e}")
+        return {
+            "success": False,
+            "error": str(e)
+        }
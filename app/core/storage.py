@@ -1,14 +1,17 @@
 import os
+import asyncio
 import logging
+import multiprocessing
 import random
+import time
 import uuid
-import cloudinary
-import cloudinary.uploader
 from datetime import datetime, UTC
-from typing import Optional, Dict, Any
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Dict, Any, List
 from io import BytesIO
 from PIL import Image, ImageDraw, ImageFont
 from dotenv import load_dotenv
+from .metrics import IMAGE_RENDER_SECONDS, IMAGE_UPLOAD_SECONDS
 
 # Load environment variables from .env file
 load_dotenv()
@@ -22,26 +25,49 @@ CLOUDINARY_CLOUD_NAME = os.getenv("CLOUDINARY_CLOUD_NAME")
 CLOUDINARY_API_KEY = os.getenv("CLOUDINARY_API_KEY")
 CLOUDINARY_API_SECRET = os.getenv("CLOUDINARY_API_SECRET")
 
-# Initialize Cloudinary
-cloudinary_configured = False
-try:
-    if CLOUDINARY_CLOUD_NAME and CLOUDINARY_API_KEY and CLOUDINARY_API_SECRET:
+# Image rendering workers and upload concurrency
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+MAX_CONCURRENT_UPLOADS = int(os.getenv("MAX_CONCURRENT_UPLOADS", "4"))
+
+_image_executor = None
+_upload_slots = None
+_cloudinary_uploader = None
+_cloudinary_checked = False
+
+def _get_cloudinary_uploader():
+    """Import and configure the Cloudinary SDK on first use; None means mock storage."""
+    global _cloudinary_uploader, _cloudinary_checked
+    if _cloudinary_checked:
+        return _cloudinary_uploader
+    _cloudinary_checked = True
+    if not (CLOUDINARY_CLOUD_NAME and CLOUDINARY_API_KEY and CLOUDINARY_API_SECRET):
+        logger.warning("Cloudinary credentials not found in environment variables. Using mock storage.")
+        return None
+    try:
+        import cloudinary
+        import cloudinary.uploader
         cloudinary.config(
             cloud_name=CLOUDINARY_CLOUD_NAME,
             api_key=CLOUDINARY_API_KEY,
             api_secret=CLOUDINARY_API_SECRET,
             secure=True
         )
-        cloudinary_configured = True
+        _cloudinary_uploader = cloudinary.uploader
         logger.info(f"Cloudinary client initialized for cloud: {CLOUDINARY_CLOUD_NAME}")
-    else:
-        logger.warning("Cloudinary credentials not found in environment variables. Using mock storage.")
-except Exception as e:
-    logger.error(f"Could not initialize Cloudinary client: {e}")
+    except Exception as e:
+        logger.error(f"Could not initialize Cloudinary client: {e}")
+    return _cloudinary_uploader
 
 async def upload_image(file_data: BytesIO, filename: str) -> Dict[str, Any]:
     """Upload an image to Cloudinary and return URL."""
-    if not cloudinary_configured:
+    start = time.perf_counter()
+    result = await _upload_image(file_data, filename)
+    IMAGE_UPLOAD_SECONDS.labels("success" if result.get("success") else "error").observe(time.perf_counter() - start)
+    return result
+
+async def _upload_image(file_data: BytesIO, filename: str) -> Dict[str, Any]:
+    uploader = _get_cloudinary_uploader()
+    if uploader is None:
         # If no Cloudinary configured, use mock storage
         return await mock_upload_image(filename)
     
@@ -55,15 +81,18 @@ async def upload_image(file_data: BytesIO, filename: str) -> Dict[str, Any]:
         file_base = filename.split('.')[0] if '.' in filename else filename
         public_id = f"{folder}/{file_base}_{unique_id}"
         
-        # Upload to Cloudinary
+        # Upload to Cloudinary; the SDK is blocking, so run it in a thread and
+        # cap how many uploads are in flight at once
         file_data.seek(0)
-        upload_result = cloudinary.uploader.upload(
-            file_data,
-            public_id=public_id,
-            folder=folder,
-            overwrite=True,
-            resource_type="image"
-        )
+        async with _get_upload_slots():
+            upload_result = await asyncio.to_thread(
+                uploader.upload,
+                file_data,
+                public_id=public_id,
+                folder=folder,
+                overwrite=True,
+                resource_type="image"
+            )
         
         logger.info(f"Uploaded image to Cloudinary: {public_id}")
         
@@ -102,68 +131,125 @@ async def mock_upload_image(filename: str) -> Dict[str, Any]:
         "format": filename.split('.')[-1] if '.' in filename else "jpg"
     }
 
+def _get_image_executor() -> ProcessPoolExecutor:
+    global _image_executor
+    if _image_executor is None:
+        # Forking would copy the serial threads and their locks into the workers
+        _image_executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS,
+                                              mp_context=multiprocessing.get_context("spawn"))
+    return _image_executor
+
+def _get_upload_slots() -> asyncio.Semaphore:
+    global _upload_slots
+    if _upload_slots is None:
+        _upload_slots = asyncio.Semaphore(MAX_CONCURRENT_UPLOADS)
+    return _upload_slots
+
+async def run_in_image_worker(func, *args):
+    """Run CPU-bound image work in the worker pool, off the event loop."""
+    loop = asyncio.get_running_loop()
+    with IMAGE_RENDER_SECONDS.time():
+        return await loop.run_in_executor(_get_image_executor(), func, *args)
+
+def shutdown_image_workers():
+    """Stop the image rendering processes (application shutdown)."""
+    global _image_executor
+    if _image_executor is not None:
+        _image_executor.shutdown(wait=False, cancel_futures=True)
+        _image_executor = None
+
+def render_plant_image(row: int, col: int, has_issue: bool = False,
+                       issue_type: Optional[str] = None) -> tuple:
+    """Draw and JPEG-encode a mock plant image; runs in a worker process, so it stays a top-level function."""
+    # Create a new image with a green or problematic background
+    width, height = 400, 300
+    img = Image.new('RGB', (width, height), color = 'green' if not has_issue else 'yellowgreen')
+    draw = ImageDraw.Draw(img)
+    
+    # Draw grid coordinates
+    draw.text((10, 10), f"Slot ({row+1},{col+1})", fill=(255, 255, 255))
+    
+    # Draw timestamp
+    timestamp = datetime.now(UTC).strftime("%Y-%m-%d %H:%M:%S")
+    draw.text((10, 30), f"Time: {timestamp}", fill=(255, 255, 255))
+    
+    # Draw plant-like shape
+    center_x, center_y = width // 2, height // 2
+    
+    # Draw stem
+    draw.rectangle([center_x-5, center_y, center_x+5, center_y+100], fill=(101, 67, 33))
+    
+    # Draw leaves
+    draw.ellipse([center_x-50, center_y-20, center_x+50, center_y+30], fill=(0, 100, 0))
+    
+    # If there's an issue, draw the issue
+    if has_issue:
+        if issue_type == "pest":
+            # Draw some "pests"
+            for _ in range(5):
+                x = random.randint(center_x-60, center_x+60)
+                y = random.randint(center_y-30, center_y+40)
+                draw.ellipse([x-5, y-5, x+5, y+5], fill=(0, 0, 0))
+        
+        elif issue_type == "disease":
+            # Draw "disease" spots
+            for _ in range(7):
+                x = random.randint(center_x-60, center_x+60)
+                y = random.randint(center_y-30, center_y+40)
+                draw.ellipse([x-8, y-8, x+8, y+8], fill=(139, 69, 19))
+        
+        elif issue_type == "growth_problem":
+            # Draw wilting leaves
+            draw.ellipse([center_x-50, center_y-20, center_x+50, center_y+30], fill=(107, 142, 35))
+        
+        # Draw issue label
+        draw.text((10, 50), f"Issue: {issue_type}", fill=(255, 0, 0))
+    
+    # Save to BytesIO
+    img_byte_arr = BytesIO()
+    img.save(img_byte_arr, format='JPEG')
+    
+    # Generate a filename
+    filename = f"plant_slot_{row+1}_{col+1}_{timestamp.replace(' ', '_').replace(':', '-')}.jpg"
+    
+    return img_byte_arr.getvalue(), filename
+
 async def generate_mock_plant_image(row: int, col: int, has_issue: bool = False, 
                                     issue_type: Optional[str] = None) -> Dict[str, Any]:
     """Generate a mock plant image for demonstration."""
     try:
-        # Create a new image with a green or problematic background
-        width, height = 400, 300
-        img = Image.new('RGB', (width, height), color = 'green' if not has_issue else 'yellowgreen')
-        draw = ImageDraw.Draw(img)
-        
-        # Draw grid coordinates
-        draw.text((10, 10), f"Slot ({row+1},{col+1})", fill=(255, 255, 255))
-        
-        # Draw timestamp
-        timestamp = datetime.now(UTC).strftime("%Y-%m-%d %H:%M:%S")
-        draw.text((10, 30), f"Time: {timestamp}", fill=(255, 255, 255))
-        
-        # Draw plant-like shape
-        center_x, center_y = width // 2, height // 2
-        
-        # Draw stem
-        draw.rectangle([center_x-5, center_y, center_x+5, center_y+100], fill=(101, 67, 33))
-        
-        # Draw leaves
-        draw.ellipse([center_x-50, center_y-20, center_x+50, center_y+30], fill=(0, 100, 0))
-        
-        # If there's an issue, draw the issue
-        if has_issue:
-            if issue_type == "pest":
-                # Draw some "pests"
-                for _ in range(5):
-                    x = random.randint(center_x-60, center_x+60)
-                    y = random.randint(center_y-30, center_y+40)
-                    draw.ellipse([x-5, y-5, x+5, y+5], fill=(0, 0, 0))
-            
-            elif issue_type == "disease":
-                # Draw "disease" spots
-                for _ in range(7):
-                    x = random.randint(center_x-60, center_x+60)
-                    y = random.randint(center_y-30, center_y+40)
-                    draw.ellipse([x-8, y-8, x+8, y+8], fill=(139, 69, 19))
-            
-            elif issue_type == "growth_problem":
-                # Draw wilting leaves
-                draw.ellipse([center_x-50, center_y-20, center_x+50, center_y+30], fill=(107, 142, 35))
-            
-            # Draw issue label
-            draw.text((10, 50), f"Issue: {issue_type}", fill=(255, 0, 0))
-        
-        # Save to BytesIO
-        img_byte_arr = BytesIO()
-        img.save(img_byte_arr, format='JPEG')
-        img_byte_arr.seek(0)
-        
-        # Generate a filename
-        filename = f"plant_slot_{row+1}_{col+1}_{timestamp.replace(' ', '_').replace(':', '-')}.jpg"
+        # Drawing and encoding are CPU-bound, so keep them off the event loop
+        image_bytes, filename = await run_in_image_worker(render_plant_image, row, col, has_issue, issue_type)
         
         # Use the upload function
-        return await upload_image(img_byte_arr, filename)
+        return await upload_image(BytesIO(image_bytes), filename)
         
     except Exception as e:
         logger.error(f"Error generating mock plant image: {e}")
         return {
             "success": False,
             "error": str(e)
-        } 
\ No newline at end of file
+        }
+
+class ImagePipeline:
+    """Renders and stores inspection images in the background; collect() returns them in submission order."""
+
+    def __init__(self, capture=None):
+        self.capture = capture or generate_mock_plant_image
+        self._pending = []
+
+    def __len__(self):
+        return len(self._pending)
+
+    def submit(self, row: int, col: int, has_issue: bool = False, issue_type: Optional[str] = None,
+               context: Optional[Dict[str, Any]] = None):
+        """Start capturing an image; `context` is merged into its result."""
+        task = asyncio.create_task(self.capture(row, col, has_issue, issue_type))
+        self._pending.append((context or {}, task))
+
+    async def collect(self) -> List[Dict[str, Any]]:
+        results = []
+        for context, task in self._pending:
+            results.append({**context, **await task})
+        self._pending = []
+        return results
@@ -1,10 +1,9 @@
-from .requests import CommandRequest, JogRequest, SlotMoveRequest, WateringRequest, PlantingRequest, MaintenanceRequest
+from .requests import CommandRequest, JogRequest, SlotMoveRequest, WateringRequest, MaintenanceRequest
 
 __all__ = [
     "CommandRequest", 
     "JogRequest", 
     "SlotMoveRequest",
     "WateringRequest", 
-    "PlantingRequest", 
     "MaintenanceRequest"
 ] 
\ No newline at end of file
@@ -6,6 +6,7 @@ class CommandRequest(BaseModel):
 
 class JogRequest(BaseModel):
     direction: str
+    feed: Optional[float] = None
 
 class SlotMoveRequest(BaseModel):
     slot_row: int
@@ -13,6 +14,8 @@ class SlotMoveRequest(BaseModel):
     
 class WateringRequest(BaseModel):
     threshold: Optional[int] = 30
-    
+    full_sweep: bool = False
+
 class MaintenanceRequest(BaseModel):
-    watering_threshold: Optional[int] = 30 
\ No newline at end of file
+    watering_threshold: Optional[int] = 30
+    full_sweep: bool = False 
\ No newline at end of file
@@ -1,3 +1,3 @@
-from .farm_ops import router as farm_ops_router
+from .farm_ops import router as farm_ops_router, history_router, save_unsaved_cycles
 
-__all__ = ["farm_ops_router"] 
\ No newline at end of file
+__all__ = ["farm_ops_router", "history_router", "save_unsaved_cycles"] 
\ No newline at end of file
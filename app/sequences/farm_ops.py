@@ -1,135 +1,104 @@
-from fastapi import APIRouter, BackgroundTasks
-import time
-import random
+import asyncio
+import logging
+from fastapi import APIRouter, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from datetime import datetime, UTC
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Literal, Optional
 from app.core import (
-    cnc, 
-    soil_moisture, 
-    grid_positions, 
+    controllers,
+    Controller,
+    job_manager,
+    Job,
+    image_spool,
+    checkpoints,
     save_maintenance_cycle,
-    save_soil_moisture_reading,
     get_maintenance_cycles,
     get_soil_moisture_history,
-    save_planting_operation,
-    generate_mock_plant_image
+    MongoJSONResponse,
+    parse_fields
 )
-from app.models import WateringRequest, PlantingRequest, MaintenanceRequest
+from app.core.metrics import MOISTURE_SENSOR_SKIPPED
+from app.models import WateringRequest, MaintenanceRequest
+from .pipeline import run_slot_pipeline
+
+logger = logging.getLogger(__name__)
 
 # Create a router for farming sequences
 router = APIRouter(prefix="/sequences", tags=["farming_sequences"])
+# History endpoints only read MongoDB, so every API worker can serve them
+history_router = APIRouter(prefix="/sequences", tags=["farming_sequences"])
 
-@router.post("/check-all-soil-moisture")
-async def check_all_soil_moisture(background_tasks: BackgroundTasks):
-    """Check soil moisture in every slot of the grid and return the readings."""
-    results = {}
-    
-    # Move to home position first
-    cnc.send_command_and_wait_response("G90 G0 X0 Y0 Z0")
-    
-    # Visit each slot in the grid
-    for row in range(3):
-        for col in range(3):
-            # Move to the slot
-            pos = grid_positions.get((row, col))
-            if not pos:
-                continue
-                
-            cnc.log(f"Moving to slot ({row+1}, {col+1})")
-            cnc.send_command_and_wait_response(f"G90 G0 {pos}")
-            
-            # Lower moisture sensor (Z axis)
-            cnc.send_command_and_wait_response("G90 G0 Z-10")
-            
-            # Simulate moisture reading (in a real system, this would read from a sensor)
-            # Currently using the mock values from the server
-            reading = soil_moisture.get((row, col), 0)
-            results[(row, col)] = reading
-            
-            cnc.log(f"Slot ({row+1}, {col+1}) moisture: {reading}%")
-            
-            # Save the reading to MongoDB in background
-            moisture_data = {
-                "position": f"{row},{col}",
-                "row": row,
-                "col": col,
-                "moisture": reading,
-                "timestamp": datetime.now(UTC)
-            }
-            background_tasks.add_task(save_soil_moisture_reading, moisture_data)
-            
-            # Raise Z axis back up
-            cnc.send_command_and_wait_response("G90 G0 Z0")
-            
-            # Small delay between movements
-            time.sleep(1)
-    
-    # Return to home position
-    cnc.send_command_and_wait_response("G90 G0 X0 Y0 Z0")
-    
-    return {"message": "Soil moisture check completed", "readings": results}
+async def _job_response(job: Job, wait: bool):
+    """Return the queued job right away, or its result once it finishes when `wait` is set."""
+    if not wait:
+        return JSONResponse(status_code=202, content=jsonable_encoder(job.to_dict()))
+    await job.wait()
+    if job.status != "completed":
+        status_code = 500 if job.status == "failed" else 409
+        return JSONResponse(status_code=status_code, content=jsonable_encoder(job.to_dict()))
+    return job.result
 
-@router.post("/water-dry-slots")
-async def water_dry_slots(request: WateringRequest, background_tasks: BackgroundTasks):
-    """Water all slots with soil moisture below the specified threshold."""
-    watered_slots = []
-    
-    # Check soil moisture in all slots first
-    moisture_data = await check_all_soil_moisture(background_tasks=background_tasks)
-    readings = moisture_data["readings"]
-    
-    # Find slots that need watering
-    for position, moisture in readings.items():
-        row, col = position
-        if moisture < request.threshold:
-            # Already at this position from the check
-            cnc.log(f"Watering slot ({row+1}, {col+1}) with moisture {moisture}%")
-            
-            # Move to the slot
-            pos = grid_positions.get((row, col))
-            if not pos:
-                continue
-                
-            cnc.send_command_and_wait_response(f"G90 G0 {pos}")
-            
-            # Lower watering mechanism
-            cnc.send_command_and_wait_response("G90 G0 Z-5")
-            
-            # Simulate watering (in a real system, this would activate a pump)
-            cnc.log(f"Watering slot ({row+1}, {col+1})...")
-            time.sleep(2)  # Simulate watering time
-            
-            # Update moisture value (simulated)
-            new_moisture = min(100, moisture + 40)  # Add 40% moisture, max 100
-            soil_moisture[(row, col)] = new_moisture
-            
-            # Raise watering mechanism
-            cnc.send_command_and_wait_response("G90 G0 Z0")
-            
-            watering_data = {
-                "position": f"{row},{col}",
-                "row": row,
-                "col": col,
-                "old_moisture": moisture,
-                "new_moisture": new_moisture,
-                "timestamp": datetime.now(UTC),
-                "operation": "watering"
-            }
-            
-            # Save to MongoDB
-            background_tasks.add_task(save_planting_operation, watering_data)
-            
-            watered_slots.append({"position": (row+1, col+1), "old_moisture": moisture, "new_moisture": new_moisture})
-    
-    # Return to home position
-    cnc.send_command_and_wait_response("G90 G0 X0 Y0 Z0")
-    
-    return {"message": f"Watering completed for {len(watered_slots)} slots", "watered_slots": watered_slots}
+async def _submit(name: str, func, *args, controller: Optional[str] = None, wait: bool = False):
+    """Queue a sequence on one controller, or on every controller in parallel when none is named."""
+    try:
+        targets = controllers.select(controller)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown controller: {controller}")
 
+    # Each controller is its own job lane, so separate beds are serviced concurrently
+    jobs = [job_manager.submit(name, func, target, *args, lane=target.id) for target in targets]
+    # Several targets list their jobs, or with `wait` map each controller to its result
+    if len(jobs) == 1:
+        return await _job_response(jobs[0], wait)
+    if not wait:
+        return JSONResponse(status_code=202, content=jsonable_encoder({"jobs": [job.to_dict() for job in jobs]}))
 
-@router.post("/full-maintenance-cycle")
-async def full_maintenance_cycle(request: MaintenanceRequest, background_tasks: BackgroundTasks):
-    """Perform a full maintenance cycle: check all soil moisture, water dry slots, and check for growth issues."""
+    await asyncio.gather(*(job.wait() for job in jobs))
+    results = {job.lane: job.result if job.status == "completed" else job.to_dict() for job in jobs}
+    status_code = 200 if all(job.status == "completed" for job in jobs) else 207
+    return JSONResponse(status_code=status_code, content=jsonable_encoder({"results": results}))
+
+async def _sense_plan(controller: Controller, threshold: int, full_sweep: bool) -> Optional[List]:
+    """Slots whose moisture might be below `threshold`, or None when every slot should be sensed."""
+    model = controller.forecast
+    # Until calibrated, candidates() is every slot too
+    if full_sweep or model.sweep_due():
+        return None
+    await model.calibrate(controller.id)
+    slots = model.candidates(threshold)
+    skipped = len(controller.grid) - len(slots)
+    if skipped:
+        MOISTURE_SENSOR_SKIPPED.labels(controller.id).inc(skipped)
+    controller.cnc.log(f"Drying model: sensing {len(slots)} slots, {skipped} predicted above {threshold}%")
+    return slots
+
+def _sense_summary(controller: Controller, sense_slots: Optional[List]) -> Dict[str, Any]:
+    sensed = len(controller.grid) if sense_slots is None else len(sense_slots)
+    return {"full_sweep": sense_slots is None, "sensed": sensed, "skipped": len(controller.grid) - sensed}
+
+async def soil_moisture_sequence(job: Job, controller: Controller) -> Dict[str, Any]:
+    """Check soil moisture in every slot of the grid."""
+    data = await run_slot_pipeline(controller.grid.slots(), sense=True, job=job, controller=controller)
+    controller.forecast.record_sweep()
+    return {"message": "Soil moisture check completed", "readings": data["readings"], "errors": data["errors"]}
+
+async def watering_sequence(job: Job, controller: Controller, threshold: int,
+                            full_sweep: bool = False) -> Dict[str, Any]:
+    """Water slots below the threshold, visiting only those the drying model cannot rule out."""
+    sense_slots = await _sense_plan(controller, threshold, full_sweep)
+    # Each slot is sensed and, if dry, watered in the same visit
+    data = await run_slot_pipeline(controller.grid.slots(), sense=True, water=True, threshold=threshold,
+                                   job=job, controller=controller, sense_slots=sense_slots)
+    if sense_slots is None:
+        controller.forecast.record_sweep()
+    watered_slots = data["watered_slots"]
+    return {"message": f"Watering completed for {len(watered_slots)} slots", "watered_slots": watered_slots,
+            "moisture_model": _sense_summary(controller, sense_slots)}
+
+async def maintenance_sequence(job: Job, controller: Controller, watering_threshold: int,
+                               cycle_id: Optional[str] = None, full_sweep: bool = False) -> Dict[str, Any]:
+    """Check all soil moisture, water dry slots, and check for growth issues; resumes `cycle_id` if given."""
     results = {
         "stage": "starting",
         "soil_check": None,
@@ -137,92 +106,166 @@ async def full_maintenance_cycle(request: MaintenanceRequest, background_tasks:
         "issues_detected": [],
         "images": []
     }
-    
-    # Step 1: Check soil moisture
-    cnc.log("Starting full maintenance cycle - Checking soil moisture")
-    soil_data = await check_all_soil_moisture(background_tasks=background_tasks)
-    results["soil_check"] = soil_data["readings"]
-    results["stage"] = "soil_check_completed"
-    
-    # Step 2: Water dry slots
-    cnc.log("Maintenance cycle - Watering dry slots")
-    watering_request = WateringRequest(threshold=request.watering_threshold)
-    watering_data = await water_dry_slots(watering_request, background_tasks=background_tasks)
-    results["watering"] = watering_data["watered_slots"]
-    results["stage"] = "watering_completed"
-    
-    # Step 3: Visual inspection of each slot (simulated)
-    cnc.log("Maintenance cycle - Performing visual inspection")
-    
-    for row in range(3):
-        for col in range(3):
-            # Move to the slot
-            pos = grid_positions.get((row, col))
-            if not pos:
-                continue
-                
-            cnc.log(f"Inspecting slot ({row+1}, {col+1})")
-            cnc.send_command_and_wait_response(f"G90 G0 {pos}")
-            
-            # Lower camera/sensor
-            cnc.send_command_and_wait_response("G90 G0 Z-8")
-            
-            # Simulate visual inspection (in a real system, this would use a camera)
-            time.sleep(1)
-            
-            # Random chance to detect an issue (simulated)
-            has_issue = random.random() < 0.2  # 20% chance to find an issue
-            issue_type = None
-            
-            if has_issue:
-                issue_type = random.choice(["pest", "disease", "growth_problem"])
-                severity = random.randint(1, 5)
-                results["issues_detected"].append({
-                    "position": (row+1, col+1),
-                    "issue": issue_type,
-                    "severity": severity
-                })
-                cnc.log(f"Issue detected at ({row+1}, {col+1}): {issue_type}")
-            
-            # Generate a mock plant image
-            image_data = await generate_mock_plant_image(row, col, has_issue, issue_type)
-            if image_data["success"]:
-                results["images"].append({
-                    "position": (row+1, col+1),
-                    "url": image_data["url"],
-                    "has_issue": has_issue,
-                    "issue_type": issue_type
-                })
-            
-            # Raise camera/sensor
-            cnc.send_command_and_wait_response("G90 G0 Z0")
-    
-    # Return to home position
-    cnc.send_command_and_wait_response("G90 G0 X0 Y0 Z0")
+
+    if cycle_id:
+        checkpoint = await checkpoints.load(cycle_id)
+        if checkpoint is None:
+            raise ValueError(f"Maintenance cycle {cycle_id} has no checkpoint")
+        controller.cnc.log(f"Resuming maintenance cycle {cycle_id} with "
+                           f"{len(checkpoint.remaining())} of {len(checkpoint.slots)} slots left")
+        full_sweep = checkpoint.params.get("full_sweep", True)
+    # Only slots the drying model cannot rule out as dry are sensed, unless this is a full sweep
+    sense_slots = await _sense_plan(controller, watering_threshold, full_sweep)
+    if not cycle_id:
+        checkpoint = await checkpoints.create("full-maintenance-cycle", controller.id, controller.grid.slots(),
+                                              {"watering_threshold": watering_threshold,
+                                               "full_sweep": sense_slots is None})
+        controller.cnc.log("Starting full maintenance cycle")
+    results["cycle_id"] = checkpoint.id
+    results["moisture_model"] = _sense_summary(controller, sense_slots)
+
+    # Sense, water and inspect every slot in a single pass over the grid
+    async with checkpoints.running(checkpoint, resume=bool(cycle_id)):
+        data = await run_slot_pipeline(checkpoint.slots, sense=True, water=True, inspect=True,
+                                       threshold=watering_threshold, job=job, controller=controller,
+                                       checkpoint=checkpoint, sense_slots=sense_slots)
+    if sense_slots is None:
+        controller.forecast.record_sweep()
+    results["soil_check"] = data["readings"]
+    results["watering"] = data["watered_slots"]
+    results["issues_detected"] = data["issues_detected"]
+    results["images"] = data["images"]
+    results["timings"] = data["timings"]
     results["stage"] = "completed"
     
     # Save the entire maintenance cycle data to MongoDB
     maintenance_data = {
         "timestamp": datetime.now(UTC),
+        "controller": controller.id,
+        "cycle_id": checkpoint.id,
+        "runs": checkpoint.runs,
+        "moisture_model": results["moisture_model"],
         "soil_moisture": results["soil_check"],
         "watering": results["watering"],
         "issues_detected": results["issues_detected"],
-        "images": [img["url"] for img in results["images"]]
+        # Spooled images may already be uploaded; store their URLs directly
+        "images": [image_spool.resolve(img["url"]) for img in results["images"]],
+        "timings": results["timings"]
     }
     
     doc_id = await save_maintenance_cycle(maintenance_data)
     results["maintenance_id"] = doc_id
+    if doc_id:
+        await checkpoints.complete(checkpoint, doc_id)
+        # Catch uploads that finished while the cycle was being saved
+        await image_spool.reconcile()
+    else:
+        # Keep the result in the journal; it is saved on resume or the next startup
+        await checkpoints.mark_unsaved(checkpoint, maintenance_data)
     
     return results
 
-@router.get("/maintenance-history")
-async def get_maintenance_history(limit: int = 10, skip: int = 0):
-    """Get the history of maintenance cycles."""
-    cycles = await get_maintenance_cycles(limit=limit, skip=skip)
-    return {"maintenance_cycles": cycles}
-
-@router.get("/moisture-history")
-async def get_moisture_history(row: Optional[int] = None, col: Optional[int] = None, limit: int = 50):
-    """Get the history of soil moisture readings for a specific slot or all slots."""
-    readings = await get_soil_moisture_history(slot_row=row, slot_col=col, limit=limit)
-    return {"moisture_history": readings} 
\ No newline at end of file
+async def save_unsaved_cycle(checkpoint) -> Optional[str]:
+    """Retry saving a finished cycle MongoDB did not take; returns its id once saved."""
+    document = dict(checkpoint.document)
+    document["timestamp"] = datetime.fromisoformat(document["timestamp"])
+    # Images uploaded since the cycle finished are stored by URL
+    document["images"] = [image_spool.resolve(image) for image in document.get("images", [])]
+    doc_id = await save_maintenance_cycle(document)
+    if doc_id:
+        await checkpoints.complete(checkpoint, doc_id)
+        await image_spool.reconcile()
+    return doc_id
+
+async def save_unsaved_cycles():
+    """Retry saving every finished cycle MongoDB did not take."""
+    for checkpoint in await checkpoints.list():
+        if checkpoint.status == "unsaved" and await save_unsaved_cycle(checkpoint):
+            logger.info(f"Saved maintenance cycle {checkpoint.id} left unsaved earlier")
+
+@router.post("/check-all-soil-moisture")
+async def check_all_soil_moisture(wait: bool = False, controller: Optional[str] = None):
+    """Queue a soil moisture check of every slot. Returns the job, or its result with `wait=true`."""
+    return await _submit("check-all-soil-moisture", soil_moisture_sequence, controller=controller, wait=wait)
+
+@router.post("/water-dry-slots")
+async def water_dry_slots(request: WateringRequest, wait: bool = False, controller: Optional[str] = None):
+    """Queue watering of all slots below the threshold. Returns the job, or its result with `wait=true`."""
+    # `full_sweep` visits slots the drying model predicts to be above the threshold too
+    return await _submit("water-dry-slots", watering_sequence, request.threshold, request.full_sweep,
+                         controller=controller, wait=wait)
+
+@router.post("/full-maintenance-cycle")
+async def full_maintenance_cycle(request: MaintenanceRequest, wait: bool = False, controller: Optional[str] = None):
+    """Queue a full maintenance cycle. Returns the job, or its result with `wait=true`."""
+    # `full_sweep` senses slots the drying model rules out as well
+    return await _submit("full-maintenance-cycle", maintenance_sequence, request.watering_threshold, None,
+                         request.full_sweep, controller=controller, wait=wait)
+
+async def _get_checkpoint(cycle_id: str):
+    checkpoint = await checkpoints.load(cycle_id)
+    if checkpoint is None:
+        raise HTTPException(status_code=404, detail="Checkpoint not found")
+    return checkpoint
+
+@router.get("/checkpoints")
+async def list_checkpoints(controller: Optional[str] = None):
+    """List maintenance cycles that are running, were interrupted or are not saved yet, most recently active first."""
+    return {"checkpoints": [checkpoint.summary() for checkpoint in await checkpoints.list()
+                            if controller is None or checkpoint.controller == controller]}
+
+@router.get("/checkpoints/{cycle_id}")
+async def get_checkpoint(cycle_id: str):
+    """Get a checkpoint with the results of every slot it finished."""
+    return (await _get_checkpoint(cycle_id)).to_dict()
+
+@router.post("/checkpoints/{cycle_id}/resume")
+async def resume_maintenance_cycle(cycle_id: str, wait: bool = False):
+    """Queue the rest of an interrupted maintenance cycle on its controller, or save an unsaved one."""
+    checkpoint = await _get_checkpoint(cycle_id)
+    # A cycle that finished but was not saved only needs saving
+    if checkpoint.status == "unsaved":
+        doc_id = await save_unsaved_cycle(checkpoint)
+        if doc_id is None:
+            raise HTTPException(status_code=503, detail="Database unavailable; cycle is still unsaved")
+        return {"cycle_id": cycle_id, "maintenance_id": doc_id}
+    if checkpoint.status != "interrupted":
+        raise HTTPException(status_code=409, detail=f"Cycle is {checkpoint.status}")
+    try:
+        target = controllers.get(checkpoint.controller)
+    except KeyError:
+        raise HTTPException(status_code=409, detail=f"Controller {checkpoint.controller} is not configured")
+    if target.cnc.serial_conn is None or target.cnc.state == "Alarm":
+        raise HTTPException(status_code=409, detail=f"Controller {target.id} is {target.cnc.state.lower()}; "
+                                                    "reconnect or clear the alarm before resuming")
+    return await _submit("full-maintenance-cycle", maintenance_sequence,
+                         checkpoint.params.get("watering_threshold"), cycle_id,
+                         controller=target.id, wait=wait)
+
+@router.delete("/checkpoints/{cycle_id}")
+async def discard_checkpoint(cycle_id: str):
+    """Discard an interrupted cycle's checkpoint; readings it saved stay in the history."""
+    checkpoint = await _get_checkpoint(cycle_id)
+    if checkpoint.status == "running" or not await checkpoints.delete(cycle_id):
+        raise HTTPException(status_code=409, detail=f"Cycle is {checkpoint.status}")
+    return {"cycle_id": cycle_id, "discarded": True}
+
+@history_router.get("/maintenance-history", response_class=MongoJSONResponse)
+async def get_maintenance_history(limit: int = 10, cursor: Optional[str] = None, fields: Optional[str] = None,
+                                  controller: Optional[str] = None):
+    """Get maintenance cycles, newest first; pass `next_cursor` as `cursor` for the next page."""
+    try:
+        cycles, next_cursor = await get_maintenance_cycles(limit=limit, cursor=cursor, fields=parse_fields(fields),
+                                                           controller=controller)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return MongoJSONResponse({"maintenance_cycles": cycles, "next_cursor": next_cursor})
+
+@history_router.get("/moisture-history", response_class=MongoJSONResponse)
+async def get_moisture_history(row: Optional[int] = None, col: Optional[int] = None, limit: int = 50,
+                               start: Optional[datetime] = None, end: Optional[datetime] = None,
+                               resolution: Literal["raw", "hour", "day"] = "raw", controller: Optional[str] = None):
+    """Get the history of soil moisture readings; `resolution=hour` or `day` returns min/max/mean/count rollups."""
+    readings = await get_soil_moisture_history(slot_row=row, slot_col=col, limit=limit,
+                                               start=start, end=end, resolution=resolution, controller=controller)
+    return MongoJSONResponse({"moisture_history": readings, "resolution": resolution})
@@ -0,0 +1,275 @@
+import random
+import time
+from datetime import datetime, UTC
+from typing import Dict, Any, List, Optional, Tuple
+from app.core import (
+    controllers,
+    Controller,
+    plan_route,
+    save_soil_moisture_reading,
+    save_planting_operation,
+    ImagePipeline,
+    capture_plant_image,
+    Job,
+    JobCancelled,
+    checkpoints,
+    Checkpoint
+)
+from app.core.cnc import NO_CONNECTION, TIMEOUT, RESET, MOTION_TIMEOUT
+from app.core.metrics import CNC_STAGE_SECONDS, MOISTURE_SENSOR_VISITS
+
+# Tool depths (Z) and dwell times (seconds) for each stage of a slot visit
+SENSOR_DEPTH = -10
+WATERING_DEPTH = -5
+CAMERA_DEPTH = -8
+SENSOR_SETTLE_TIME = 1
+WATERING_TIME = 2
+CAMERA_SETTLE_TIME = 1
+
+# Where the gantry parks at the end of a sequence
+HOME_POSITION = {"X": 0.0, "Y": 0.0, "Z": 0.0}
+
+# Responses after which the machine's state is unknown (GRBL answers error:9
+# to every line while alarmed), so carrying on would only fail every slot
+MACHINE_LOST = {NO_CONNECTION, TIMEOUT, RESET, "error:9"}
+
+class MachineLost(Exception):
+    """Raised when the controller disconnects, alarms or resets in the middle of a sequence."""
+
+def _check_machine(controller: Controller, errors: List[Dict[str, Any]]):
+    for error in errors:
+        if error["response"] in MACHINE_LOST or controller.cnc.state == "Alarm":
+            raise MachineLost(f"Controller {controller.id} stopped responding normally at "
+                              f"'{error['command']}': {error['response']}")
+
+async def _run_stages(controller: Controller, stages: List[Tuple[str, List[str]]],
+                      on_stage_done=None) -> Tuple[Dict[str, float], List[Dict[str, Any]]]:
+    """Stream a list of (stage, lines) as one program and time each stage."""
+    program = []
+    markers = {}
+    for stage, lines in stages:
+        program.extend(lines)
+        markers[len(program)] = stage
+        # Acknowledged only once the stage's motion and dwells are done
+        program.append("G4 P0")
+
+    durations = {}
+    last = None
+
+    def on_ack(index, response):
+        nonlocal last
+        if index not in markers:
+            return
+        now = time.monotonic()
+        stage = markers[index]
+        durations[stage] = durations.get(stage, 0.0) + now - last
+        CNC_STAGE_SECONDS.labels(controller.id, stage).observe(now - last)
+        last = now
+        if on_stage_done:
+            on_stage_done(stage)
+
+    last = time.monotonic()
+    # A stage's G4 P0 is only acknowledged once its motion ends, which can take a long move
+    acks = await controller.cnc.stream_program(program, on_ack=on_ack, timeout=MOTION_TIMEOUT)
+    errors = [ack for ack in acks if not ack["ok"]]
+    for error in errors:
+        controller.cnc.log(f"Line {error['command']} failed: {error['response']}")
+    return durations, errors
+
+async def run_slot_pipeline(slots: List[Tuple[int, int]], sense: bool = True, water: bool = False, inspect: bool = False,
+                            threshold: Optional[int] = None, job: Optional[Job] = None,
+                            controller: Optional[Controller] = None,
+                            checkpoint: Optional[Checkpoint] = None,
+                            sense_slots: Optional[List[Tuple[int, int]]] = None) -> Dict[str, Any]:
+    """Visit each slot once, in plan_route order, and run the enabled tools there: sense, water if dry, photograph."""
+    controller = controller or controllers.default
+    cnc, grid, soil_moisture = controller.cnc, controller.grid, controller.moisture
+    results = {
+        "readings": {},
+        "watered_slots": [],
+        "issues_detected": [],
+        "images": [],
+        "errors": []
+    }
+    # Slots a checkpoint already holds are skipped and their results reused
+    if checkpoint:
+        for done in checkpoint.completed.values():
+            if done.get("moisture") is not None:
+                results["readings"][done["position"]] = done["moisture"]
+            if done.get("watered"):
+                results["watered_slots"].append(done["watered"])
+            results["issues_detected"].extend(done.get("issues", []))
+        results["images"].extend(checkpoint.images)
+        slots = [slot for slot in slots if f"{slot[0]},{slot[1]}" not in checkpoint.completed]
+    stage_totals = {}
+    slot_timings = {}
+
+    async def capture(row, col, has_issue, issue_type):
+        image = await capture_plant_image(row, col, has_issue, issue_type)
+        if checkpoint and image.get("success"):
+            await checkpoints.record_image(checkpoint, {"position": (row+1, col+1), "url": image["url"],
+                                                        "has_issue": has_issue, "issue_type": issue_type})
+        return image
+
+    # Images go to the local spool and upload in the background, so the
+    # cycle never waits on the network
+    images = ImagePipeline(capture=capture)
+    cycle_start = time.monotonic()
+
+    def record(row, col, durations):
+        slot_key = f"{row},{col}"
+        slot_timings.setdefault(slot_key, {})
+        for stage, seconds in durations.items():
+            slot_timings[slot_key][stage] = slot_timings[slot_key].get(stage, 0.0) + seconds
+            stage_totals[stage] = stage_totals.get(stage, 0.0) + seconds
+
+    if sense_slots is not None:
+        sense_slots = set(map(tuple, sense_slots))
+        if not inspect:
+            # Nothing else to do at a slot that is not sensed
+            slots = [slot for slot in slots if slot in sense_slots]
+    route = plan_route(slots, start=cnc.position, end=HOME_POSITION, grid=grid)
+    results["route"] = [(row+1, col+1) for row, col in route]
+
+    if job:
+        job.set_total(len(route))
+
+    try:
+        for row, col in route:
+            pos = grid.gcode(row, col)
+            if not pos:
+                continue
+
+            cnc.log(f"Servicing slot ({row+1}, {col+1})")
+            moisture = None
+            watered = None
+            sense_here = sense and (sense_slots is None or (row, col) in sense_slots)
+            issues_before = len(results["issues_detected"])
+
+            # The whole visit is one batch unit that leaves the tool raised,
+            # so an operator given the machine between slots never drags it
+            async with cnc.scheduler.batch(job):
+                # Travel to the slot and, if enabled, take a moisture reading
+                stages = [("travel", ["G90 G0 Z0", f"G90 G0 {pos}"])]
+                if sense_here:
+                    stages.append(("sense", [f"G90 G0 Z{SENSOR_DEPTH}", f"G4 P{SENSOR_SETTLE_TIME}"]))
+                durations, errors = await _run_stages(controller, stages)
+                record(row, col, durations)
+                results["errors"].extend(errors)
+                _check_machine(controller, errors)
+
+                if sense_here:
+                    MOISTURE_SENSOR_VISITS.labels(controller.id).inc()
+                    # Simulate moisture reading (in a real system, this would read from a sensor)
+                    # Currently using the mock values from the server
+                    moisture = soil_moisture.get(row, col, 0)
+                    soil_moisture.record(row, col, moisture)
+                    results["readings"][f"{row},{col}"] = moisture
+                    cnc.log(f"Slot ({row+1}, {col+1}) moisture: {moisture:g}%")
+
+                    # Queue the reading for the batched MongoDB writer
+                    await save_soil_moisture_reading({
+                        "controller": controller.id,
+                        "position": f"{row},{col}",
+                        "row": row,
+                        "col": col,
+                        "moisture": moisture,
+                        "timestamp": datetime.now(UTC)
+                    })
+
+                # Remaining tools run at the same XY without returning to Z0
+                stages = []
+                needs_water = water and moisture is not None and threshold is not None and moisture < threshold
+                if needs_water:
+                    cnc.log(f"Watering slot ({row+1}, {col+1}) with moisture {moisture:g}%")
+                    stages.append(("water", [f"G90 G0 Z{WATERING_DEPTH}", f"G4 P{WATERING_TIME}"]))
+                if inspect:
+                    stages.append(("inspect", [f"G90 G0 Z{CAMERA_DEPTH}", f"G4 P{CAMERA_SETTLE_TIME}"]))
+                stages.append(("travel", ["G90 G0 Z0"]))
+
+                def on_stage_done(stage, row=row, col=col):
+                    if stage == "inspect":
+                        _capture(cnc, row, col, results, images)
+
+                durations, errors = await _run_stages(controller, stages, on_stage_done=on_stage_done)
+                record(row, col, durations)
+                results["errors"].extend(errors)
+                _check_machine(controller, errors)
+
+            if needs_water:
+                # Update moisture value (simulated)
+                new_moisture = min(100, moisture + 40)  # Add 40% moisture, max 100
+                soil_moisture.record(row, col, new_moisture)
+
+                await save_planting_operation({
+                    "controller": controller.id,
+                    "position": f"{row},{col}",
+                    "row": row,
+                    "col": col,
+                    "old_moisture": moisture,
+                    "new_moisture": new_moisture,
+                    "timestamp": datetime.now(UTC),
+                    "operation": "watering"
+                })
+                watered = {"position": (row+1, col+1), "old_moisture": moisture, "new_moisture": new_moisture}
+                results["watered_slots"].append(watered)
+
+            if checkpoint:
+                await checkpoints.record_slot(checkpoint, row, col, moisture=moisture, watered=watered,
+                                              issues=results["issues_detected"][issues_before:])
+            if job:
+                # Cancellation stops the sequence here, then the tool is raised and homed
+                job.report_slot(row, col, moisture=moisture, watered=needs_water)
+    finally:
+        # Raise the tool and return to home position
+        home = " ".join(f"{axis}{value:g}" for axis, value in HOME_POSITION.items())
+        try:
+            async with cnc.scheduler.batch(job):
+                durations, errors = await _run_stages(controller, [("travel", ["G90 G0 Z0", f"G90 G0 {home}"])])
+            for stage, seconds in durations.items():
+                stage_totals[stage] = stage_totals.get(stage, 0.0) + seconds
+            results["errors"].extend(errors)
+        except JobCancelled:
+            # Cancelled while paused or held by an operator; the tool is already raised
+            cnc.log("Cancelled before returning home")
+
+    # Images were rendered and uploaded while the gantry moved on; collect them now
+    if len(images):
+        upload_start = time.monotonic()
+        for image_data in await images.collect():
+            if image_data["success"]:
+                results["images"].append({
+                    "position": image_data["position"],
+                    "url": image_data["url"],
+                    "has_issue": image_data["has_issue"],
+                    "issue_type": image_data["issue_type"]
+                })
+        stage_totals["image_collection"] = time.monotonic() - upload_start
+
+    results["timings"] = {
+        "total": time.monotonic() - cycle_start,
+        "stages": stage_totals,
+        "slots": slot_timings
+    }
+    return results
+
+def _capture(cnc, row: int, col: int, results: Dict[str, Any], images: ImagePipeline):
+    """Inspect the slot under the camera and hand its image to the image pipeline."""
+    cnc.log(f"Inspecting slot ({row+1}, {col+1})")
+
+    # Random chance to detect an issue (simulated)
+    has_issue = random.random() < 0.2  # 20% chance to find an issue
+    issue_type = None
+
+    if has_issue:
+        issue_type = random.choice(["pest", "disease", "growth_problem"])
+        severity = random.randint(1, 5)
+        results["issues_detected"].append({
+            "position": (row+1, col+1),
+            "issue": issue_type,
+            "severity": severity
+        })
+        cnc.log(f"Issue detected at ({row+1}, {col+1}): {issue_type}")
+
+    images.submit(row, col, has_issue, issue_type,
+                  context={"position": (row+1, col+1), "has_issue": has_issue, "issue_type": issue_type})
@@ -0,0 +1,229 @@
+"""End-to-end benchmarks for the API and farm sequences.
+
+Runs the FastAPI app in-process against the simulated GRBL controller and
+an in-memory MongoDB stand-in (mongomock-motor), and prints one JSON
+document so results can be stored and compared across commits:
+
+    python -m benchmarks.run --clients 20 --requests 50 --cycles 2 --output bench.json
+
+Pass --mongo-uri to measure against a real MongoDB server instead. The
+stand-in is installed with `pip install -r benchmarks/requirements.txt`.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, UTC
+
+ENDPOINTS = [
+    "/status",
+    "/position",
+    "/soil-moisture",
+    "/logs?limit=50",
+    "/jobs",
+    "/sequences/maintenance-history?limit=10",
+]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=10, help="concurrent clients per endpoint")
+    parser.add_argument("--requests", type=int, default=50, help="requests per client")
+    parser.add_argument("--cycles", type=int, default=1, help="full maintenance cycles to time")
+    parser.add_argument("--writes", type=int, default=5000, help="sensor readings for the DB write benchmark")
+    parser.add_argument("--speedup", type=float, default=20.0, help="simulated controller time scale")
+    parser.add_argument("--grid", help="GRID_CONFIG file to benchmark a different layout")
+    parser.add_argument("--mongo-uri", help="real MongoDB to use instead of the in-memory stand-in")
+    parser.add_argument("--output", help="write the JSON results to this file as well as stdout")
+    return parser.parse_args()
+
+def configure(args):
+    """Point the app at the simulator before any app module reads its settings."""
+    os.environ["CNC_PORT"] = "sim"
+    os.environ["CNC_SIM_SPEEDUP"] = str(args.speedup)
+    os.environ["CNC_LOG_CONSOLE"] = "0"
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    os.environ["IMAGE_SPOOL_DIR"] = tempfile.mkdtemp(prefix="agro-bench-spool-")
+    os.environ["CHECKPOINT_DIR"] = tempfile.mkdtemp(prefix="agro-bench-checkpoints-")
+    os.environ["MONGO_URI"] = args.mongo_uri or ""
+    if args.grid:
+        os.environ["GRID_CONFIG"] = args.grid
+    for name in ("CLOUDINARY_CLOUD_NAME", "CLOUDINARY_API_KEY", "CLOUDINARY_API_SECRET"):
+        os.environ[name] = ""
+
+def percentiles(samples):
+    """Latency summary in milliseconds."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": pick(0.50),
+        "p90_ms": pick(0.90),
+        "p99_ms": pick(0.99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+async def bench_endpoint(client, path, clients, requests):
+    latencies = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        for _ in range(requests):
+            start = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    return {**percentiles(latencies), "errors": errors, "requests_per_second": len(latencies) / elapsed}
+
+def upload_totals():
+    """Successful image uploads so far and the seconds they took in total."""
+    from app.core.metrics import IMAGE_UPLOAD_SECONDS
+
+    uploads = IMAGE_UPLOAD_SECONDS.labels("success")
+    return sum(uploads.counts), uploads.sum
+
+async def wait_for_uploads(count, before, timeout=60.0):
+    """Wait until `count` more uploads than `before` finished; returns their count and seconds."""
+    deadline = time.perf_counter() + timeout
+    while upload_totals()[0] - before[0] < count and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    after = upload_totals()
+    return after[0] - before[0], after[1] - before[1]
+
+async def bench_cycles(client, cycles):
+    """Time full maintenance cycles, split into travel, dwell, I/O and image collection, and their uploads."""
+    runs = []
+    for _ in range(cycles):
+        uploads_before = upload_totals()
+        start = time.perf_counter()
+        response = await client.post("/sequences/full-maintenance-cycle?wait=true",
+                                     json={"watering_threshold": 50}, timeout=None)
+        wall = time.perf_counter() - start
+        timings = response.json().get("timings", {})
+        stages = timings.get("stages", {})
+        travel = stages.get("travel", 0.0)
+        # Tool stages: plunging the sensor, nozzle or camera and dwelling there
+        dwell = sum(stages.get(stage, 0.0) for stage in ("sense", "water", "inspect"))
+        # Waiting for captured images to reach the spool; uploads run in the background
+        collection = stages.get("image_collection", 0.0)
+        uploads, upload_seconds = await wait_for_uploads(len(response.json().get("images", [])), uploads_before)
+        runs.append({
+            "status_code": response.status_code,
+            "wall_s": wall,
+            "pipeline_s": timings.get("total", 0.0),
+            "travel_s": travel,
+            "dwell_s": dwell,
+            "image_collection_s": collection,
+            # Everything the pipeline did besides moving: DB writes, logging, planning, hand-offs
+            "io_s": max(0.0, timings.get("total", 0.0) - travel - dwell - collection),
+            "uploads": uploads,
+            "upload_mean_s": upload_seconds / uploads if uploads else None,
+            "stages": stages,
+        })
+    return {
+        "runs": runs,
+        "mean_wall_s": statistics.fmean(run["wall_s"] for run in runs) if runs else None,
+    }
+
+async def bench_writes(count):
+    """Sensor readings per second through the batched writer, including rollup updates."""
+    from app.core import batch_writer, save_soil_moisture_reading
+
+    if not batch_writer.running:
+        return {"error": "batch writer not running"}
+    done = batch_writer.written + batch_writer.dropped
+    start = time.perf_counter()
+    for i in range(count):
+        await save_soil_moisture_reading({
+            "position": f"{i % 3},{i // 3 % 3}",
+            "row": i % 3,
+            "col": i // 3 % 3,
+            "moisture": i % 100,
+            "timestamp": datetime.now(UTC)
+        })
+    enqueued = time.perf_counter() - start
+    while batch_writer.written + batch_writer.dropped < done + count:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    return {
+        "documents": count,
+        "enqueue_s": enqueued,
+        "total_s": elapsed,
+        "documents_per_second": count / elapsed,
+        "dropped": batch_writer.dropped,
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def main(args):
+    import httpx
+    from main import app, lifespan
+    from app.core import connect_to_mongo, controllers, grid
+
+    if not args.mongo_uri:
+        from mongomock_motor import AsyncMongoMockClient
+        await connect_to_mongo(AsyncMongoMockClient())
+
+    results = {
+        "commit": git_revision(),
+        "timestamp": datetime.now(UTC).isoformat(),
+        "python": platform.python_version(),
+        "config": {
+            "clients": args.clients,
+            "requests": args.requests,
+            "cycles": args.cycles,
+            "writes": args.writes,
+            "speedup": args.speedup,
+            "grid": grid.summary(),
+            "mongo": "server" if args.mongo_uri else "mongomock",
+        },
+    }
+
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            # Controllers connect in the background; then let the banner and first status report arrive
+            while not all(controller.cnc.serial_conn for controller in controllers.all()):
+                await asyncio.sleep(0.05)
+            await asyncio.sleep(0.5)
+            results["sequences"] = await bench_cycles(client, args.cycles)
+            results["endpoints"] = {
+                path: await bench_endpoint(client, path, args.clients, args.requests)
+                for path in ENDPOINTS
+            }
+            results["db_writes"] = await bench_writes(args.writes)
+    return results
+
+if __name__ == "__main__":
+    args = parse_args()
+    configure(args)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    results = asyncio.run(main(args))
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
@@ -0,0 +1,8 @@
+import uvicorn
+from app.core.device import DEVICE_SOCKET
+
+if __name__ == "__main__":
+    if not DEVICE_SOCKET:
+        raise SystemExit("Set DEVICE_SOCKET to the Unix socket the device daemon should listen on")
+    # One process owns the serial ports, jobs and sequences; API workers reach it over the socket
+    uvicorn.run("main:device_app", uds=DEVICE_SOCKET)
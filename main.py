@@ -1,17 +1,72 @@
+import asyncio
+import contextlib
+import os
 import uvicorn
 from contextlib import asynccontextmanager
-from app import create_app
-from app.core import connect_to_mongo, close_mongo_connection
+from app import create_app, create_gateway
+from app.core import (
+    controllers,
+    connect_to_mongo,
+    close_mongo_connection,
+    batch_writer,
+    job_manager,
+    image_spool,
+    shutdown_image_workers,
+    device_client
+)
+from app.core.device import DEVICE_SOCKET
+from app.sequences import save_unsaved_cycles
+
+# API worker processes when a device daemon owns the hardware (DEVICE_SOCKET set)
+API_WORKERS = int(os.getenv("API_WORKERS", "4"))
+
+async def prepare_database():
+    await connect_to_mongo()
+    # Save maintenance cycles that finished while MongoDB was unavailable
+    await save_unsaved_cycles()
 
 @asynccontextmanager
 async def lifespan(app):
-    # Connect to MongoDB on startup
-    await connect_to_mongo()
+    # Controllers and MongoDB connect in the background so the API serves immediately
+    controllers.start()
+    mongo_connect = asyncio.create_task(prepare_database())
+    # Resume uploading any images spooled before the last shutdown
+    await image_spool.start()
     yield
+    # Stop queued and running jobs before releasing resources
+    await job_manager.stop()
+    await image_spool.stop()
+    mongo_connect.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await mongo_connect
+    # Flush readings still buffered for MongoDB
+    await batch_writer.stop()
+    shutdown_image_workers()
+    controllers.stop()
     # Close MongoDB connection on shutdown
     await close_mongo_connection()
 
-app = create_app(lifespan=lifespan)
+@asynccontextmanager
+async def gateway_lifespan(app):
+    # Workers only read MongoDB; the device daemon runs the hardware, jobs and writes
+    mongo_connect = asyncio.create_task(connect_to_mongo())
+    device_client.start()
+    yield
+    await device_client.stop()
+    mongo_connect.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await mongo_connect
+    await batch_writer.stop()
+    await close_mongo_connection()
+
+# The whole API in one process; device.py serves it on DEVICE_SOCKET
+device_app = create_app(lifespan=lifespan)
+
+app = create_gateway(lifespan=gateway_lifespan) if DEVICE_SOCKET else device_app
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
+    if DEVICE_SOCKET:
+        # Start device.py first; every worker forwards hardware calls to it
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=API_WORKERS)
+    else:
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
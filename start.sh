@@ -9,6 +9,13 @@ fi
 PORT=8000
 DOMAIN=${NGROK_DOMAIN:-""}
 
+# With a device socket configured, the daemon owns the hardware and the API runs several workers
+if [ -n "$DEVICE_SOCKET" ]; then
+  echo "Starting device daemon on $DEVICE_SOCKET..."
+  python device.py &
+  DEVICE_PID=$!
+fi
+
 # Start the backend server in the background
 echo "Starting FastAPI backend server on port $PORT..."
 python main.py &
@@ -41,6 +48,7 @@ cleanup() {
   echo "Shutting down..."
   kill $NGROK_PID 2>/dev/null
   kill $SERVER_PID 2>/dev/null
+  [ -n "$DEVICE_PID" ] && kill $DEVICE_PID 2>/dev/null
   exit 0
 }
 